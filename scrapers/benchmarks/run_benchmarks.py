@@ -0,0 +1,296 @@
+"""Offline benchmarks for the scraper hot paths.
+
+Every benchmark runs against the checked-in corpus (benchmarks/corpus) or the
+local simulator (benchmarks/simulator.py), never against bibliometro.cl. Each one runs in its own
+subprocess so its peak RSS is measured in isolation. The report is JSON:
+
+    python benchmarks/run_benchmarks.py                      # all, writes results/<commit>.json
+    python benchmarks/run_benchmarks.py --only extract_book
+    python benchmarks/run_benchmarks.py --compare results/abc1234.json
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPERS_DIR = os.path.join(BENCH_DIR, '..')
+sys.path.insert(0, SCRAPERS_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BOOK_PAGES = ["book.html", "book_no_stock.html"]
+TWO_AUTHORS_PAGE = "book_two_authors.html"  # no plain <h4> author, two "Autor:" labels
+LISTING_PAGE = "listing.html"
+SITEMAP = "sitemap.xml"
+SITEMAP_IMAGES = "sitemap_images.xml"  # Yoast-style entries with <image:image> extensions
+MIN_SECONDS = 2.0  # each micro-benchmark repeats until it has run this long
+
+
+def read_corpus(name):
+    with open(os.path.join(CORPUS_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def _repeat(fn, pages):
+    """Calls fn(page) over `pages` until MIN_SECONDS elapse. Returns (pages done, seconds)."""
+    done = 0
+    started = time.perf_counter()
+    while True:
+        for page in pages:
+            fn(page)
+        done += len(pages)
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_SECONDS:
+            return done, elapsed
+
+
+# --- Benchmarks: each returns (pages processed, seconds) -------------------
+
+def bench_extract_book():
+    from book_extractor import extract_book
+    # The first "Autor:" label is the book's, a later one belongs to something else
+    book = extract_book(read_corpus(TWO_AUTHORS_PAGE), "https://bibliometro.cl/libros/bench/")
+    assert book["author"] == "Gabriel García Márquez", book["author"]
+    pages = [read_corpus(name) for name in BOOK_PAGES]
+    return _repeat(lambda html: extract_book(html, "https://bibliometro.cl/libros/bench/"), pages)
+
+
+def bench_extract_locations():
+    from book_extractor import extract_locations
+    return _repeat(extract_locations, [read_corpus(name) for name in BOOK_PAGES])
+
+
+def bench_book_fields():
+    """Availability, category and description of a page from one parse and one extract_fields() pass."""
+    from book_extractor import extract_fields, get_availability, get_category, get_description, parse_html
+
+    def fields(html):
+        page = extract_fields(parse_html(html))
+        return get_availability(page), get_category(page), get_description(page)
+
+    return _repeat(fields, [read_corpus(page) for page in BOOK_PAGES])
+
+
+def bench_extract_book_links():
+    from bibliometro_urls import extract_book_links
+    return _repeat(extract_book_links, [read_corpus(LISTING_PAGE).decode('utf-8')])
+
+
+class _CorpusResponse:
+    """The part of requests.Response that sitemaps.parse_sitemap() reads."""
+
+    status_code = 200
+    headers = {}
+
+    def __init__(self, body):
+        self.body = body
+
+    def iter_content(self, chunk_size):
+        stream = io.BytesIO(self.body)
+        return iter(lambda: stream.read(chunk_size), b'')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _CorpusSession:
+    def __init__(self, bodies):
+        self.bodies = bodies
+
+    def get(self, url, **kwargs):
+        return _CorpusResponse(self.bodies[url])
+
+
+def _sitemap_bench(url, body):
+    # Counted in sitemap entries rather than pages
+    from sitemaps import parse_sitemap
+    session = _CorpusSession({url: body})
+    entries = sum(1 for _ in parse_sitemap(session, url))
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < MIN_SECONDS:
+        for _ in parse_sitemap(session, url):
+            pass
+        done += entries
+    return done, time.perf_counter() - started
+
+
+def bench_parse_sitemap():
+    return _sitemap_bench("https://bibliometro.cl/post-sitemap.xml", read_corpus(SITEMAP))
+
+
+def bench_parse_sitemap_gz():
+    return _sitemap_bench("https://bibliometro.cl/post-sitemap.xml.gz", gzip.compress(read_corpus(SITEMAP)))
+
+
+def bench_parse_sitemap_gz_decoded():
+    # A .xml.gz sent with Content-Encoding: gzip reaches the parser already decoded
+    from sitemaps import parse_sitemap
+    url, body = "https://bibliometro.cl/post-sitemap.xml.gz", read_corpus(SITEMAP)
+    plain = "https://bibliometro.cl/post-sitemap.xml"
+    session = _CorpusSession({url: body, plain: body})
+    assert list(parse_sitemap(session, url)) == list(parse_sitemap(session, plain))
+    return _sitemap_bench(url, body)
+
+
+def bench_parse_sitemap_images():
+    from sitemaps import parse_sitemap
+    url, body = "https://bibliometro.cl/libros-sitemap.xml", read_corpus(SITEMAP_IMAGES)
+    # A nested <image:loc> must never stand in for the page's own <loc>
+    assert all('/libros/' in loc for _, loc, _ in parse_sitemap(_CorpusSession({url: body}), url))
+    return _sitemap_bench(url, body)
+
+
+def bench_url_frontier():
+    # Every sitemap URL added twice: the master sees most books in several sources
+    import re
+    from frontier import UrlFrontier
+    urls = re.findall(r'<loc>([^<]+)</loc>', read_corpus(SITEMAP).decode('utf-8'))
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < MIN_SECONDS:
+        frontier = UrlFrontier("https://bibliometro.cl")
+        for url in urls + urls:
+            frontier.add(url)
+        done += 2 * len(urls)
+    return done, time.perf_counter() - started
+
+
+def bench_worker_pipeline(count=2000):
+    import bibliometro_details
+    from simulator import Simulator
+    simulator = Simulator(books=count)
+    base = simulator.start_in_thread()
+    bibliometro_details.API_URL = f"{base}/api/books/batch"
+    bibliometro_details.API_SECRET = "bench"
+    urls = [f"{base}/libros/{simulator.catalog.book(i)['slug']}/" for i in range(count)]
+    started = time.perf_counter()
+    asyncio.run(bibliometro_details.run_details(urls, concurrency=32, rps=0))
+    return count, time.perf_counter() - started
+
+
+BENCHMARKS = {
+    "extract_book": bench_extract_book,
+    "extract_locations": bench_extract_locations,
+    "book_fields": bench_book_fields,
+    "extract_book_links": bench_extract_book_links,
+    "parse_sitemap": bench_parse_sitemap,
+    "parse_sitemap_gz": bench_parse_sitemap_gz,
+    "parse_sitemap_gz_decoded": bench_parse_sitemap_gz_decoded,
+    "parse_sitemap_images": bench_parse_sitemap_images,
+    "url_frontier": bench_url_frontier,
+    "worker_pipeline": bench_worker_pipeline,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process plus its finished children, in MB."""
+    if resource is None:
+        return None
+    kb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+          + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    if sys.platform == 'darwin':
+        kb /= 1024  # bytes on macOS
+    return round(kb / 1024, 1)
+
+
+def run_one(name):
+    """Runs one benchmark in this process and prints its result as JSON (used by the subprocesses)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        pages, seconds = BENCHMARKS[name]()
+    print(json.dumps({
+        "pages": pages,
+        "seconds": round(seconds, 4),
+        "pages_per_sec": round(pages / seconds, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRAPERS_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(names):
+    results = {}
+    for name in names:
+        print(f"⏱️  {name}...", file=sys.stderr)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", name],
+                              capture_output=True, text=True, cwd=SCRAPERS_DIR)
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            results[name] = {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed"}
+            continue
+        results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"   {results[name]['pages_per_sec']:>10.1f} pages/s   "
+              f"peak RSS {results[name]['peak_rss_mb']} MB", file=sys.stderr)
+    return {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "benchmarks": results,
+    }
+
+
+def compare(report, baseline):
+    """Prints pages/sec and peak RSS of `report` relative to `baseline`."""
+    print(f"{'benchmark':<20} {'base p/s':>10} {'new p/s':>10} {'speedup':>8} {'base MB':>8} {'new MB':>8}")
+    for name, new in report["benchmarks"].items():
+        old = baseline["benchmarks"].get(name)
+        if not old or "error" in old or "error" in new:
+            print(f"{name:<20} {'-':>10} {new.get('pages_per_sec', '-'):>10}")
+            continue
+        speedup = new["pages_per_sec"] / old["pages_per_sec"] if old["pages_per_sec"] else float('inf')
+        print(f"{name:<20} {old['pages_per_sec']:>10.1f} {new['pages_per_sec']:>10.1f} "
+              f"{speedup:>7.2f}x {old['peak_rss_mb'] or 0:>8.1f} {new['peak_rss_mb'] or 0:>8.1f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline scraper benchmarks")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS),
+                        help="Run only these benchmarks")
+    parser.add_argument('--output', help="Report path (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', metavar='REPORT', help="Baseline report to compare against")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        run_one(args.child)
+        sys.exit(0)
+
+    report = run_all(args.only or list(BENCHMARKS))
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit'] or 'report'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 Report written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(report, json.load(f))
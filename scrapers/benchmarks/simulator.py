@@ -0,0 +1,324 @@
+"""Local stand-in for bibliometro.cl and the Bookwise batch API.
+
+Serves a synthetic catalog of any size, rendered from the corpus book page:
+
+    /sitemap_index.xml                      index of libros-sitemapN.xml(.gz) children
+    /catalogo/?categoria=X                  paginated listings, 24 books per page
+    /catalogo/page/N/?categoria=X
+    /libros/<slug>/                         book pages with ETag / If-None-Match support
+    POST /api/books/batch, /api/books/stock accepts uploads (gzip or plain JSON)
+    GET /stats                              request and upload counters
+
+Book i is derived from its index alone, so 100k books cost no memory. Latency,
+5xx and 429 rates are configurable. Point the scrapers at it with:
+
+    python benchmarks/simulator.py --books 100000 --latency-ms 40 --error-rate 0.01
+    BIBLIOMETRO_BASE_URL=http://127.0.0.1:8080 BOOKWISE_API_URL=http://127.0.0.1:8080 \\
+        python bibliometro_urls.py
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from aiohttp import web
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+CATEGORIES = [
+    "Literatura", "Arte", "Autoayuda", "Biografías", "Ciencias sociales",
+    "Cocina", "Cómics", "Ecología", "Esoterismo", "Filosofía",
+    "Género", "Historia", "Literatura infantil", "Literatura juvenil",
+    "Manualidades", "Periodismo", "Poesía", "Pueblos Originarios",
+    "Sagas", "Salud física y mental"
+]
+BRANCHES = [
+    "Los Dominicos", "La Cisterna", "Baquedano", "Puente Alto", "Plaza de Maipú",
+    "Universidad de Chile", "Tobalaba", "Vicente Valdés", "Plaza Egaña", "San Pablo",
+    "Los Héroes", "Ñuble", "Cal y Canto", "Franklin", "Estación Central"
+]
+WORDS = [
+    "sombra", "ciudad", "memoria", "jardín", "océano", "corazón", "silencio", "viaje",
+    "montaña", "canción", "noche", "árbol", "río", "ventana", "fuego", "isla",
+    "camino", "espejo", "niña", "lluvia", "estrella", "invierno", "pájaro", "ángel"
+]
+AUTHORS = [
+    "Isabel Allende", "Gabriela Mistral", "Pablo Neruda", "Roberto Bolaño", "María Luisa Bombal",
+    "Alejandro Zambra", "Nona Fernández", "José Donoso", "Marcela Serrano", "Hernán Rivera Letelier"
+]
+
+PAGE_SIZE = 24
+SITEMAP_SIZE = 2000
+VOLATILE_EVERY = 10  # one book in ten changes stock every churn period
+
+# Strings of corpus/book.html replaced by per-book values
+TEMPLATE_FIELDS = [
+    ("1, 2, 3 :¿me lo cuentas otra vez? /", "title"),
+    ("1, 2, 3 :¿me lo cuentas otra vez?", "title"),
+    ("1, 2, 3 :¿me lo cuentas otr...", "title"),
+    ("1-2-3-me-lo-cuentas-otra-vez-2", "slug"),
+    ("<h4>Alejandra Acosta Argomedo</h4>", "author"),
+    ("Aprender  A  Contar  Literatura  Infantil  Obras  Ilustradas /  Libros  Didácticos /  "
+     "Números  Literatura  Infantil", "category"),
+    ("18 páginas sin numerar", "pages"),
+]
+FIELD_RE = re.compile('\x00(\\w+)\x00')
+STOCK_LIST_RE = re.compile(r'(<ul class="estaciones">)\s*<li>.*?(</ul>)')
+DESCRIPTION_RE = re.compile(r'(<h3 class="tit-h3">Resumen de libro</h3>\s*<p>).*?(</p>)', re.S)
+
+STOCK_ITEM = ('<li><span class="ico-metro"></span> {branch} <em class="ico-serv serv-1 disabed  open-tooltip" '
+              'data-toggle="tooltip" title="Disponible" ><span>{stock}</span></em></li>')
+
+
+def slugify(text):
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def load_template():
+    with open(os.path.join(CORPUS_DIR, "book.html"), encoding='utf-8') as f:
+        html = f.read()
+    html = STOCK_LIST_RE.sub('\\1\x00stock\x00\\2', html)
+    html = DESCRIPTION_RE.sub('\\1\x00description\x00\\2', html)
+    for original, field in TEMPLATE_FIELDS:
+        value = f"<h4>\x00{field}\x00</h4>" if original.startswith("<h4>") else f"\x00{field}\x00"
+        if field == "pages":
+            value = "\x00pages\x00 páginas"
+        html = html.replace(original, value)
+    return html
+
+
+class Catalog:
+    """Deterministic synthetic catalog: every field of book i is derived from (seed, i)."""
+
+    def __init__(self, size, seed=0, churn_seconds=0.0):
+        self.size = size
+        self.seed = seed
+        self.churn_seconds = churn_seconds
+        self.template = load_template()
+
+    def book(self, i):
+        rnd = random.Random(f"{self.seed}-{i}")
+        title = f"{rnd.choice(WORDS).capitalize()} {rnd.choice(WORDS)} {i}"
+        return {
+            "index": i,
+            "title": title,
+            "slug": slugify(title),
+            "author": rnd.choice(AUTHORS),
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "pages": rnd.randint(40, 900),
+            "description": " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 80))).capitalize() + ".",
+            "lastmod": f"2026-{rnd.randint(1, 9):02d}-{rnd.randint(10, 28)}T00:00:00+00:00",
+        }
+
+    def stock(self, i, now):
+        period = int(now // self.churn_seconds) if self.churn_seconds and i % VOLATILE_EVERY == 0 else 0
+        rnd = random.Random(f"{self.seed}-{i}-stock-{period}")
+        return [(branch, rnd.randint(0, 3)) for branch in rnd.sample(BRANCHES, rnd.randint(0, 5))]
+
+    def index_of(self, slug):
+        """Book index from a slug ('<words>-<i>'), or None if it is not in the catalog."""
+        tail = slug.rsplit('-', 1)[-1]
+        if not tail.isdigit() or int(tail) >= self.size:
+            return None
+        i = int(tail)
+        return i if self.book(i)["slug"] == slug else None
+
+    def render(self, i, now):
+        book = self.book(i)
+        values = {key: str(value) for key, value in book.items()}
+        values["stock"] = "".join(STOCK_ITEM.format(branch=branch, stock=stock)
+                                  for branch, stock in self.stock(i, now))
+        return FIELD_RE.sub(lambda m: values[m.group(1)], self.template)
+
+    def in_category(self, category):
+        first = CATEGORIES.index(category) if category in CATEGORIES else None
+        if first is None:
+            return range(0)
+        return range(first, self.size, len(CATEGORIES))
+
+
+class Simulator:
+    def __init__(self, books=1000, latency_ms=0.0, error_rate=0.0, rate_429=0.0,
+                 api_latency_ms=0.0, churn_seconds=0.0, seed=0, api_secret=None):
+        self.catalog = Catalog(books, seed, churn_seconds)
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.api_latency = api_latency_ms / 1000
+        self.api_secret = api_secret
+        self.random = random.Random(seed)
+        self.stats = Counter()
+        self.base_url = None
+
+    # --- Site ---------------------------------------------------------------
+
+    @web.middleware
+    async def faults(self, request, handler):
+        """Latency, 5xx and 429 injection for every GET to the site."""
+        if request.method != 'GET' or request.path == '/stats':
+            return await handler(request)
+        self.stats["requests"] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(0.5, 1.5))
+        roll = self.random.random()
+        if roll < self.rate_429:
+            self.stats["status_429"] += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        if roll < self.rate_429 + self.error_rate:
+            self.stats["status_503"] += 1
+            return web.Response(status=503)
+        response = await handler(request)
+        self.stats[f"status_{response.status}"] += 1
+        return response
+
+    async def book_page(self, request):
+        i = self.catalog.index_of(request.match_info['slug'])
+        if i is None:
+            return web.Response(status=404)
+        body = self.catalog.render(i, time.time()).encode('utf-8')
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        self.stats["bytes"] += len(body)
+        return web.Response(body=body, content_type='text/html', charset='utf-8', headers={"ETag": etag})
+
+    async def listing(self, request):
+        page = int(request.match_info.get('page', 1))
+        books = self.catalog.in_category(request.query.get('categoria', ''))
+        chunk = books[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        if not chunk:
+            return web.Response(status=404)
+        cards = "\n".join(
+            f'<div class="book-card"><a href="/libros/{self.catalog.book(i)["slug"]}/">'
+            f'<h5>{self.catalog.book(i)["title"]}</h5></a></div>'
+            for i in chunk
+        )
+        html = f'<!doctype html><html><body><div class="row">{cards}</div></body></html>'
+        return web.Response(text=html, content_type='text/html')
+
+    def _xml(self, body, gz):
+        body = body.encode('utf-8')
+        if gz:
+            return web.Response(body=gzip.compress(body), content_type='application/gzip')
+        return web.Response(body=body, content_type='application/xml')
+
+    async def sitemap_index(self, request):
+        count = (self.catalog.size + SITEMAP_SIZE - 1) // SITEMAP_SIZE
+        entries = "".join(
+            f"<sitemap><loc>{self.base_url}/libros-sitemap{n}.xml{'.gz' if n % 2 == 0 else ''}</loc></sitemap>"
+            for n in range(1, count + 1)
+        )
+        return self._xml(f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex '
+                         f'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>', False)
+
+    async def sitemap(self, request):
+        n = int(request.match_info['n'])
+        start = (n - 1) * SITEMAP_SIZE
+        if n < 1 or start >= self.catalog.size:
+            return web.Response(status=404)
+        entries = []
+        for i in range(start, min(start + SITEMAP_SIZE, self.catalog.size)):
+            book = self.catalog.book(i)
+            entries.append(f"<url><loc>{self.base_url}/libros/{book['slug']}/</loc>"
+                           f"<lastmod>{book['lastmod']}</lastmod></url>")
+        return self._xml(f'<?xml version="1.0" encoding="UTF-8"?><urlset '
+                         f'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{"".join(entries)}</urlset>',
+                         bool(request.match_info['gz']))
+
+    # --- API ----------------------------------------------------------------
+
+    async def upload(self, request):
+        if self.api_secret and request.headers.get('x-api-secret') != self.api_secret:
+            return web.json_response({"error": "Unauthorized: Invalid API Secret"}, status=401)
+        body = await request.read()
+        if body[:2] == b'\x1f\x8b':  # in case the server did not inflate Content-Encoding: gzip
+            body = gzip.decompress(body)
+        books = json.loads(body)
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency * self.random.uniform(0.5, 1.5))
+        kind = "stock" if request.path.endswith('/stock') else "batch"
+        self.stats[f"{kind}_requests"] += 1
+        self.stats[f"{kind}_books"] += len(books)
+        return web.json_response({"success": True, "count": len(books)})
+
+    async def stats_page(self, request):
+        return web.json_response(dict(self.stats))
+
+    def app(self):
+        app = web.Application(middlewares=[self.faults], client_max_size=64 * 1024 * 1024)
+        app.router.add_get('/sitemap_index.xml', self.sitemap_index)
+        app.router.add_get(r'/libros-sitemap{n:\d+}.xml{gz:(\.gz)?}', self.sitemap)
+        app.router.add_get('/catalogo/', self.listing)
+        app.router.add_get(r'/catalogo/page/{page:\d+}/', self.listing)
+        app.router.add_get('/libros/{slug}/', self.book_page)
+        app.router.add_post('/api/books/batch', self.upload)
+        app.router.add_post('/api/books/stock', self.upload)
+        app.router.add_get('/stats', self.stats_page)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Starts serving on the running loop and returns the base URL."""
+        runner = web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    def start_in_thread(self, host='127.0.0.1', port=0):
+        """Runs the simulator on its own event loop thread. Returns the base URL."""
+        ready = threading.Event()
+
+        def serve():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start(host, port))
+            ready.set()
+            loop.run_forever()
+
+        threading.Thread(target=serve, name="simulator", daemon=True).start()
+        ready.wait()
+        return self.base_url
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local bibliometro.cl + batch API simulator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--books', type=int, default=1000, help="Catalog size")
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help="Mean page latency (uniform between 0.5x and 1.5x)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of GETs answered 503")
+    parser.add_argument('--rate-429', type=float, default=0.0,
+                        help="Fraction of GETs answered 429 with Retry-After: 1")
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="Mean upload latency")
+    parser.add_argument('--churn-seconds', type=float, default=0.0,
+                        help="Every N seconds, one book in ten gets new stock (0 = static)")
+    parser.add_argument('--api-secret', default=None, help="Require this x-api-secret on uploads")
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+async def main(args):
+    simulator = Simulator(books=args.books, latency_ms=args.latency_ms, error_rate=args.error_rate,
+                          rate_429=args.rate_429, api_latency_ms=args.api_latency_ms,
+                          churn_seconds=args.churn_seconds, seed=args.seed, api_secret=args.api_secret)
+    base_url = await simulator.start(args.host, args.port)
+    print(f"🧪 Simulating {args.books} books at {base_url} (stats: {base_url}/stats)")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,242 +1,611 @@
 
-import requests
-from bs4 import BeautifulSoup
+import argparse
+import asyncio
+import aiohttp
 import os
-import hashlib
+import queue
 import time
-import random
-import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from dotenv import load_dotenv
+from book_extractor import timed_extract
+from metrics import Metrics
+from rate_limit import AdaptiveRateController, parse_retry_after
+from shards import ShardProgress, select_shard, shard_name, state_path
+from snapshots import new_snapshot, prune_snapshots
+from snapshot_diff import covers_catalog, diff_snapshots, previous_snapshot
+from pg_loader import CopyUploader, DATABASE_URL
+from uploader import BatchUploader
+from worker_state import open_state, LastmodStore, ValidatorStore, UploadHashStore, Journal
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
-# Configuration
-API_URL = "http://localhost:3001/api/books/batch"
+# Configuration (override the API host with BOOKWISE_API_URL, e.g. for the local simulator)
+API_BASE_URL = os.getenv('BOOKWISE_API_URL', 'http://localhost:3001').rstrip('/')
+API_URL = f"{API_BASE_URL}/api/books/batch"
 API_SECRET = os.getenv('API_SECRET')
 URLS_FILE = os.path.join(os.path.dirname(__file__), "bibliometro_final_urls.txt")
+DELTA_FILE = os.path.join(os.path.dirname(__file__), "bibliometro_delta_urls.txt")
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
 
-def generate_id(source, title):
-    """Generates a deterministic ID based on title."""
-    raw_id = f"{source}-{title}".lower().replace(' ', '-')
-    return hashlib.md5(raw_id.encode()).hexdigest()[:12]
-
-def get_availability(soup):
-    """Extracts branch availability."""
-    locations = []
-    # Search for headers like "Ubicación de este libro"
-    header = soup.find(lambda tag: tag.name in ['h4', 'h5', 'h3'] and "ubicación" in tag.get_text(strip=True).lower())
-    
-    if header:
-        ul = header.find_next('ul')
-        if ul:
-            lis = ul.find_all('li')
-            for li in lis:
-                text_content = li.get_text(strip=True)
-                text_content = text_content.replace('\xa0', ' ').strip()
-                
-                match = re.search(r'^(.*?)\s*(\d+)$', text_content)
-                if match:
-                    branch_name = match.group(1).strip()
-                    stock = int(match.group(2))
-                    if stock > 0:
-                        locations.append({"branch": branch_name, "stock": stock})
-    return locations
-
-def get_category(soup):
-    """Extracts category from list items."""
-    category = None
-    li = soup.find('li', class_='d-none d-sm-block', string=re.compile("Tema - Materia:"))
-    if not li:
-        # Try finding by looking for the strong tag inside
-        strong = soup.find('strong', string=re.compile("Tema - Materia:"))
-        if strong:
-            li = strong.parent
-    
-    if li:
-        text = li.get_text(strip=True)
-        if "Tema - Materia:" in text:
-            category = text.replace("Tema - Materia:", "").strip()
-    return category
-
-def get_description(soup):
-    """Extracts description from the 'Resumen de libro' section."""
-    description = None
-    h3 = soup.find('h3', class_='tit-h3', string=re.compile("Resumen de libro"))
-    if h3:
-        p = h3.find_next_sibling('p')
-        if p:
-            description = p.get_text(strip=True)
-    return description
-
-def upload_batch(books):
-    """Uploads a batch of books to the backend API."""
-    if not books:
-        return
+# Fetch engine
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RPS = 8.0       # starting rate; the controller adapts it between MIN_RPS and max_rps
+MIN_RPS = 0.5
+FETCH_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_PARSE_WORKERS = os.cpu_count() or 1
+QUEUE_DEPTH = 4  # items buffered per consumer between pipeline stages
+STREAM_POLL_SECONDS = 0.5  # how often a URL stream is polled while the master is quiet
+SINKS = ('api', 'postgres')  # where parsed books go: Express batch API or COPY into Postgres
 
-    # Deduplicate books by ID within the batch (simple strategy)
-    unique_books = {}
-    for book in books:
-        unique_books[book['id']] = book
-    
-    final_batch = list(unique_books.values())
-    
-    api_headers = {
-        "Content-Type": "application/json",
-        "x-api-secret": API_SECRET
-    }
+async def fetch_page(session, controller, url, headers=None, metrics=None):
+    """GETs a page within the host budget, retrying connection errors, 429 and 5xx.
 
-    try:
-        # Create a new session for the upload to avoid stale connection issues
-        with requests.Session() as s:
-            from requests.adapters import HTTPAdapter
-            from urllib3.util.retry import Retry
-            retry = Retry(connect=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-            adapter = HTTPAdapter(max_retries=retry)
-            s.mount('http://', adapter)
-            
-            resp = s.post(API_URL, json=final_batch, headers=api_headers, timeout=30)
-            
-            if resp.status_code == 200:
-                print(f"   🚀 Successfully uploaded batch of {len(final_batch)} books.")
-            else:
-                print(f"   ❌ API Upload failed ({resp.status_code}): {resp.text}")
-    except Exception as e:
-        print(f"   ❌ API Connection failed: {e}")
+    Every attempt's outcome is fed back to the AdaptiveRateController, which
+    also enforces Retry-After; 5xx without Retry-After additionally back off
+    exponentially. Returns (status, body bytes, response headers); body is
+    None for non-200 responses. With `metrics`, every attempt records its
+    latency, status and bytes, and every retry its reason.
+    """
+    for attempt in range(FETCH_RETRIES + 1):
+        await controller.acquire(url)
+        started = time.perf_counter()
+        released = False
+        try:
+            async with session.get(url, headers=headers) as response:
+                body = await response.read() if response.status == 200 else None
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                controller.release(url, response.status, time.perf_counter() - started, retry_after)
+                released = True
+                if metrics:
+                    metrics.observe("fetch_seconds", time.perf_counter() - started, kind="page")
+                    metrics.inc("responses_total", status=response.status)
+                    if body:
+                        metrics.inc("fetch_bytes_total", len(body))
+                if response.status in RETRY_STATUSES and attempt < FETCH_RETRIES:
+                    if metrics:
+                        metrics.inc("retries_total", reason=response.status)
+                    if retry_after is None and response.status != 429:
+                        await asyncio.sleep(2 ** attempt)
+                    continue
+                return response.status, body, response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            controller.release(url, None, time.perf_counter() - started)
+            released = True
+            if metrics:
+                metrics.inc("responses_total", status="error")
+            if attempt >= FETCH_RETRIES:
+                raise
+            if metrics:
+                metrics.inc("retries_total", reason=type(e).__name__)
+            await asyncio.sleep(2 ** attempt)
+        finally:
+            if not released:  # cancelled or unexpected error
+                controller.release(url, None, time.perf_counter() - started)
 
-def scrape_details():
-    print("👷 Starting Bibliometro WORKER Scraper (Detail Extraction)...")
-    
-    if not API_SECRET:
-        print("❌ API_SECRET not found in .env")
-        return
+@dataclass
+class RunOptions:
+    """What one run_details() call fetches with and writes to (everything optional).
 
-    if not os.path.exists(URLS_FILE):
-        print(f"❌ URL list not found: {URLS_FILE}")
-        return
+    - validators: ValidatorStore; pages are fetched conditionally and a 304
+      skips parsing and uploading. Validators are only stored once the
+      page's batch has been uploaded, so a failed upload is retried next run.
+    - hashes: UploadHashStore; records sharing an id are merged across the
+      whole catalog and only books whose content hash changed are uploaded
+      (all of them with `force_upload`).
+    - journal: Journal; every URL's progress is recorded and failed fetches
+      are re-queued with exponential backoff.
+    - lastmods: LastmodStore; a page's sitemap lastmod is confirmed together
+      with its `uploaded` journal entry, so only uploaded pages leave the delta.
+    - metrics: Metrics; each stage records its latency histograms and counters.
+    - progress: ShardProgress; every finished URL is counted in the shard's progress file.
+    - snapshot: SnapshotWriter; every parsed record is appended to the run's snapshot.
+    - archive: PageArchive; every downloaded page is also archived.
+    - replay: ArchiveReader; pages come from the archive instead of the
+      network (pass no validators: there are no response headers to store).
+    - url_stream: a queue.Queue the master fills and ends with None; URLs
+      are also fetched as they are discovered and appended to `urls`.
+    """
+
+    parse_workers: int = DEFAULT_PARSE_WORKERS
+    max_rps: float = None
+    sink: str = 'api'
+    force_upload: bool = False
+    validators: object = None
+    hashes: object = None
+    journal: object = None
+    lastmods: object = None
+    metrics: object = None
+    progress: object = None
+    snapshot: object = None
+    archive: object = None
+    replay: object = None
+    url_stream: object = None
+
+
+async def run_details(urls, concurrency, rps, options=None):
+    """Runs the fetch -> parse -> upload pipeline over `urls`.
+
+    - fetch: up to `concurrency` tasks download raw pages onto a bounded queue,
+      paced by an AdaptiveRateController starting at `rps`
+    - parse: a process pool of `parse_workers` turns pages into book_data
+    - upload: a BatchUploader thread sends adaptive-size batches to the API,
+      or with sink='postgres' a CopyUploader COPYs them into the books table
+
+    Every queue is bounded, so a slow stage throttles the ones before it.
+    `options` (a RunOptions) holds the stores and sinks the run uses.
+    """
+    options = options or RunOptions()
+    parse_workers, sink, force_upload = options.parse_workers, options.sink, options.force_upload
+    validators, hashes, journal, lastmods = options.validators, options.hashes, options.journal, options.lastmods
+    metrics, progress, snapshot = options.metrics, options.progress, options.snapshot
+    archive, replay, url_stream = options.archive, options.replay, options.url_stream
+    controller = AdaptiveRateController(rps, concurrency, min_rps=MIN_RPS, max_rps=options.max_rps, metrics=metrics)
+    savings = {"not_modified": 0, "bytes": 0, "parse_seconds": 0.0, "unchanged": 0}
+    # book id -> {page url: validator entry} waiting for that id to be uploaded
+    pending_pages = {}
+    url_queue = asyncio.Queue()
+    for item in enumerate(urls):
+        url_queue.put_nowait(item)
+    outstanding = len(urls)  # URLs queued or waiting for a retry
+    streaming = url_stream is not None  # more URLs may still arrive
+    page_queue = asyncio.Queue(maxsize=parse_workers * QUEUE_DEPTH)
+
+    timeout = aiohttp.ClientTimeout(total=30)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    loop = asyncio.get_running_loop()
+
+    def uploaded(books, ok, flush=True):
+        # Runs on the event loop thread, scheduled by the uploader thread
+        # (or inline with flush=False for unchanged books: the stores batch their commits)
+        for book in books:
+            if not ok:
+                # Keep the pages pending: close() retries the batch
+                for page_url in pending_pages.get(book['id'], {}):
+                    if journal:
+                        journal.fail(page_url, "upload failed")
+                continue
+            for page_url, entry in pending_pages.pop(book['id'], {}).items():
+                if validators and entry:
+                    validators.record(page_url, *entry)
+                if journal:
+                    journal.mark(page_url, 'uploaded')
+                if lastmods:
+                    lastmods.confirm(page_url)
+        if ok and hashes:
+            hashes.mark_uploaded(books)
+        if not flush:
+            return
+        if hashes:
+            hashes.commit()
+        if validators:
+            validators.commit()
+        if lastmods:
+            lastmods.commit()
+        if journal:
+            journal.commit()
+
+    on_uploaded = lambda books, ok: loop.call_soon_threadsafe(uploaded, books, ok)
+    if sink == 'postgres':
+        uploader = CopyUploader(DATABASE_URL, on_uploaded=on_uploaded, metrics=metrics)
+    else:
+        uploader = BatchUploader(API_URL, API_SECRET, on_uploaded=on_uploaded, metrics=metrics)
+
+    def stop_fetchers():
+        for _ in range(concurrency):
+            url_queue.put_nowait(None)
+
+    def finished():
+        nonlocal outstanding
+        outstanding -= 1
+        if progress:
+            progress.advance()
+        if outstanding == 0 and not streaming:
+            stop_fetchers()
+
+    async def feed():
+        # Moves URLs from the master's thread onto the URL queue as they are discovered
+        nonlocal outstanding, streaming
+        while streaming:
+            try:
+                batch = [await asyncio.to_thread(url_stream.get, timeout=STREAM_POLL_SECONDS)]
+            except queue.Empty:
+                continue
+            while batch[-1] is not None and not url_stream.empty():
+                batch.append(url_stream.get_nowait())
+            for url in batch:
+                if url is None:
+                    streaming = False
+                    break
+                if journal:
+                    journal.add(url)
+                url_queue.put_nowait((len(urls), url))
+                urls.append(url)
+                outstanding += 1
+        if outstanding == 0:
+            stop_fetchers()
+
+    def failed(item, reason, permanent=False):
+        print(f"      ⚠️ Failed to load page ({reason})")
+        delay = journal.fail(item[1], reason, permanent) if journal else None
+        if delay is None:
+            finished()
+        else:
+            # Retry queue: back on the URL queue once the backoff has elapsed
+            loop.call_later(delay, url_queue.put_nowait, item)
+
+    async def fetcher(session):
+        while True:
+            item = await url_queue.get()
+            if item is None:
+                return
+            i, url = item
 
-    with open(URLS_FILE, 'r', encoding='utf-8') as f:
-        urls = [line.strip() for line in f if line.strip()]
-
-    print(f"📄 Loaded {len(urls)} URLs to process.")
-    
-    # Session setup for scraping
-    session = requests.Session()
-    from requests.adapters import HTTPAdapter
-    from urllib3.util.retry import Retry
-    retry = Retry(connect=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('http://', adapter)
-    session.mount('https://', adapter)
-    
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    batch = []
-    BATCH_SIZE = 10
-    
-    for i, url in enumerate(urls):
-        try:
-            # Random delay
-            time.sleep(random.uniform(0.1, 0.4))
-            
             # Simple progress log every 10 items
             if i % 10 == 0:
-                print(f"   [{i+1}/{len(urls)}] Processing: {url}")
-            
+                print(f"   [{i+1}/{len(urls)}{'+' if streaming else ''}] Processing: {url}")
+
+            if replay:
+                body = await asyncio.to_thread(replay.read, url)
+                status, response_headers = (200, {}) if body is not None else (404, {})
+            else:
+                conditional = validators.conditional_headers(url) if validators else None
+                try:
+                    status, body, response_headers = await fetch_page(session, controller, url, conditional, metrics)
+                except Exception as e:
+                    failed(item, e)
+                    continue
+
+            if status == 304:
+                size, parse_seconds = validators.saved_cost(url)
+                savings["not_modified"] += 1
+                savings["bytes"] += size
+                savings["parse_seconds"] += parse_seconds
+                if journal:
+                    journal.mark(url, 'uploaded')
+                if lastmods:
+                    lastmods.confirm(url)
+                finished()
+                continue
+
+            if status != 200:
+                failed(item, status, permanent=status in (404, 410))
+                continue
+
+            if archive:
+                try:
+                    archive.submit(url, body, block=False)
+                except queue.Full:
+                    await asyncio.to_thread(archive.submit, url, body)
+            await page_queue.put((url, body, response_headers))
+            finished()
+
+    async def parser(pool):
+        while True:
+            item = await page_queue.get()
+            if item is None:
+                return
+            url, body, response_headers = item
             try:
-                response = session.get(url, headers=headers, timeout=30)
+                book_data, timings = await loop.run_in_executor(pool, timed_extract, body, url)
             except Exception as e:
-                print(f"      ⚠️ Failed to load page ({e})")
-                continue
-                
-            if response.status_code != 200:
-                print(f"      ⚠️ Failed to load page ({response.status_code})")
+                print(f"      ❌ Error processing {url}: {e}")
+                if journal:
+                    journal.fail(url, e, permanent=True)
                 continue
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract Title
-            title_tag = soup.find('h1', class_='entry-title') or soup.find('h1')
-            if not title_tag:
-                # Fallback check for h3 if h1 not found (some layouts)
-                candidates = soup.find_all('h3')
-                for cand in candidates:
-                    if "Resumen" not in cand.get_text() and "Ubicación" not in cand.get_text():
-                        title_tag = cand
-                        break
-            
-            if not title_tag and soup.title:
-                 raw_title = soup.title.get_text(strip=True)
-                 if " - Bibliometro" in raw_title:
-                     title = raw_title.replace(" - Bibliometro", "").strip()
-                 else:
-                     continue
-            elif title_tag:
-                title = title_tag.get_text(strip=True)
-            else:
+            parse_seconds = sum(timings.values())
+            if metrics:
+                for phase, seconds in timings.items():
+                    metrics.observe("parse_seconds", seconds, phase=phase)
+            if not book_data:
+                if journal:
+                    journal.fail(url, "no title found", permanent=True)
                 continue
 
-            # Extract Image
-            image_url = None
-            img_tag = soup.find('div', class_='book-cover')
-            if img_tag and img_tag.find('img'):
-                 image_url = img_tag.find('img').get('src')
-            elif not img_tag:
-                 img_tag = soup.find('img', class_='attachment-post-thumbnail')
-                 if img_tag: image_url = img_tag.get('src')
-            
-            # Extract Author
-            author = "Desconocido"
-            h4s = soup.find_all('h4')
-            for h4 in h4s:
-                txt = h4.get_text(strip=True)
-                if "ubicación" in txt.lower() or "comentarios" in txt.lower():
+            if journal:
+                journal.mark(url, 'fetched')
+            if snapshot:
+                snapshot.write(book_data)
+            pending_pages.setdefault(book_data['id'], {})[url] = (
+                response_headers.get('ETag'),
+                response_headers.get('Last-Modified'),
+                len(body),
+                parse_seconds
+            )
+            if hashes:
+                book_data = hashes.merge(book_data)
+                if not force_upload and not hashes.changed(book_data):
+                    savings["unchanged"] += 1
+                    uploaded([book_data], True, flush=False)
                     continue
-                if txt:
-                    author = txt
-                    break
-            
-            # Extract Pages
-            pages = None
-            strongs = soup.find_all('strong')
-            for s in strongs:
-                if "páginas" in s.get_text(strip=True).lower():
-                    sib = s.next_sibling
-                    if sib and isinstance(sib, str):
-                        match = re.search(r'(\d+)', sib)
-                        if match: pages = int(match.group(1))
-
-            locations = get_availability(soup)
-            category = get_category(soup)
-            description = get_description(soup)
-            
-            book_data = {
-                "id": f"bib_{generate_id('bibliometro', title)}",
-                "title": title[:255],
-                "author": author[:255], 
-                "pages": pages,
-                "difficulty": 3,
-                "source": "bibliometro",
-                "url": url,
-                "tags": ["bibliometro"],
-                "imageUrl": image_url,
-                "locations": locations,
-                "category": category[:255] if category else None,
-                "description": description,
-                "summary": description 
-            }
-            
-            batch.append(book_data)
-            
-            if len(batch) >= BATCH_SIZE:
-                upload_batch(batch)
-                batch = []
-                
-        except Exception as e:
-            print(f"      ❌ Error processing {url}: {e}")
-
-    # Final batch
-    if batch:
-        upload_batch(batch)
+            try:
+                uploader.submit(book_data, block=False)
+            except queue.Full:
+                await asyncio.to_thread(uploader.submit, book_data)
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        parse_tasks = [asyncio.create_task(parser(pool)) for _ in range(parse_workers)]
+
+        if urls or streaming:
+            async with aiohttp.ClientSession(headers=HEADERS, timeout=timeout, connector=connector) as session:
+                feeder = [feed()] if streaming else []
+                await asyncio.gather(*feeder, *(fetcher(session) for _ in range(concurrency)))
+
+        for _ in parse_tasks:
+            await page_queue.put(None)
+        await asyncio.gather(*parse_tasks)
+
+    # Final flush and retry of failed batches
+    await asyncio.to_thread(uploader.close)
+    await asyncio.sleep(0)  # let the last on_uploaded callbacks run
+    if hashes:
+        hashes.commit()
+    if lastmods:
+        lastmods.commit()
+    if journal:
+        journal.commit()
+    stats = uploader.stats
+    controller.record_metrics()
+    if metrics:
+        metrics.inc("pages_not_modified_total", savings["not_modified"])
+        metrics.inc("books_unchanged_total", savings["unchanged"])
+    print(f"📦 Uploaded {stats['books']} books in {stats['batches']} batches "
+          f"({stats['bytes'] / 1_000_000:.1f} MB JSON"
+          + (f", {stats['gzip_bytes'] / 1_000_000:.1f} MB gzip)." if stats['gzip_bytes'] else ")."))
+    return savings
+
+def read_url_file(path):
+    """URLs of a one-per-line list, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def load_urls(full=False):
+    """Reads the master's delta, or the whole URL list if `full` (or no delta exists yet)."""
+    urls_file = URLS_FILE if full or not os.path.exists(DELTA_FILE) else DELTA_FILE
+    urls = read_url_file(urls_file)
+    if urls is None:
+        print(f"❌ URL list not found: {urls_file}")
+        return None
+    print(f"📂 Reading {os.path.basename(urls_file)}")
+    return urls
+
+def scrape_details(concurrency=DEFAULT_CONCURRENCY, rps=DEFAULT_RPS, conditional=True, full=False,
+                   parse_workers=DEFAULT_PARSE_WORKERS, force_upload=False, resume=False, max_rps=None,
+                   shard_index=None, shard_count=None, sink='api', snapshot=True,
+                   search_index=False, url_stream=None, archive=False, master_failed=None):
+    """Scrapes the master's URL list, or with `url_stream` the URLs the master is discovering.
+
+    `master_failed` is a threading.Event the streaming master sets when its
+    discovery failed: URLS_FILE is then the previous run's list, so nothing
+    is carried over and the snapshot is not marked as covering the catalog.
+
+    Returns the URLs the journal shows as uploaded, or None if the run did not start.
+    """
+    print("👷 Starting Bibliometro WORKER Scraper (Detail Extraction)...")
+
+    if not sink_configured(sink):
+        return
+
+    sharded = shard_count is not None
+    conn = open_state(state_path(shard_index, shard_count)) if sharded else open_state()
+    journal = Journal(conn)
+    if resume:
+        urls = journal.resumable()
+        print(f"♻️ Resuming previous run: {len(urls)} URLs unfinished or due for retry.")
+    elif url_stream is not None:
+        urls = []
+        journal.start_run(urls)
+        print("📡 Streaming URLs from the master as they are discovered.")
+    else:
+        urls = load_urls(full)
+        if urls is None:
+            conn.close()
+            return
+        if sharded:
+            total = len(urls)
+            urls = select_shard(urls, shard_index, shard_count)
+            print(f"🧩 Shard {shard_index}/{shard_count}: {len(urls)} of {total} URLs.")
+        journal.start_run(urls)
+
+    print(f"📄 Loaded {len(urls)} URLs to process "
+          f"(concurrency={concurrency}, rps={rps}, parse_workers={parse_workers}).")
+
+    validators = ValidatorStore(conn) if conditional else None
+    hashes = UploadHashStore(conn)
+    # The master's lastmods live in the main state file: a shard confirms its uploads there
+    # in one transaction at the end, so parallel shards don't contend for its write lock
+    lastmods = None if sharded else LastmodStore(conn)
+    metrics = Metrics(f"details-{shard_name(shard_index, shard_count)}" if sharded else "details")
+    progress = ShardProgress(shard_index, shard_count, len(urls)) if sharded else None
+    if snapshot:
+        name = time.strftime("%Y%m%dT%H%M%S") + (f"-{shard_name(shard_index, shard_count)}" if sharded else "")
+        snapshot = new_snapshot(name, resume=resume)
+    if archive:
+        from page_archive import PageArchive
+
+        archive = PageArchive(metrics=metrics)
+    else:
+        archive = None
+
+    started = time.monotonic()
+    try:
+        options = RunOptions(parse_workers, max_rps, sink, force_upload, validators=validators, hashes=hashes,
+                             journal=journal, lastmods=lastmods, metrics=metrics, progress=progress,
+                             snapshot=snapshot or None, archive=archive, url_stream=url_stream)
+        savings = asyncio.run(run_details(urls, concurrency, rps, options))
+        status = journal.summary()
+        uploaded = journal.urls('uploaded')
+        if sharded:
+            confirm_lastmods(uploaded)
+        master_ok = master_failed is None or not master_failed.is_set()
+        catalog = read_url_file(URLS_FILE) if snapshot and master_ok else None
+        if catalog is not None:
+            # Unfetched books keep their stored record: the snapshot is the whole catalog
+            if sharded:
+                catalog = select_shard(catalog, shard_index, shard_count)
+            snapshot.carry_over(catalog, hashes)
+    except BaseException as e:
+        if progress:
+            progress.fail(repr(e))
+        if snapshot:
+            snapshot.flush()  # stays unfinished; --resume appends to it
+        raise
+    finally:
+        conn.close()
+        archived = archive.close() if archive else None
+    for name, count in status.items():
+        metrics.set("journal_urls", count, status=name)
+    changes = None
+    if snapshot:
+        manifest = snapshot.close(urls=len(urls), full=full, conditional=conditional,
+                                  complete=catalog is not None,
+                                  shard=[shard_index, shard_count] if sharded else None)
+        print(f"📸 Snapshot: {manifest['books']} records in {snapshot.path}")
+        previous = previous_snapshot(snapshot.path)
+        if previous:
+            changes = diff_snapshots(snapshot.path, previous, removals=covers_catalog(snapshot.path))
+            for name, count in changes.items():
+                metrics.set("snapshot_changes", count, type=name)
+        pruned = prune_snapshots()
+        if pruned:
+            print(f"🧹 {len(pruned)} old snapshots pruned.")
+        if search_index:
+            from search_index import SEARCH_INDEX, build_index, latest_snapshots  # needs numpy
+
+            indexed = build_index(latest_snapshots())
+            print(f"🔎 Search index rebuilt: {indexed} books in {SEARCH_INDEX}")
+    metrics.write()
+    if progress:
+        progress.finish({"savings": savings, "journal": status,
+                         "seconds": round(time.monotonic() - started, 3)})
+    print(f"🏁 Finished {len(urls)} URLs in {time.monotonic() - started:.1f}s.")
+    if conditional:
+        print(f"💾 {savings['not_modified']} pages not modified (304): saved "
+              f"{savings['bytes'] / 1_000_000:.1f} MB and {savings['parse_seconds']:.1f}s of parsing.")
+    print(f"🧮 {savings['unchanged']} books unchanged since their last upload (skipped).")
+    if archived:
+        print(f"🗄️ Archived {archived['pages']} pages ({archived['stored']} new, "
+              f"{archived['compressed_bytes'] / 1_000_000:.1f} MB compressed).")
+    if changes:
+        print(f"🔀 Changes since the previous snapshot: "
+              + ", ".join(f"{count} {name}" for name, count in changes.items()))
+    print(f"📒 Journal: " + ", ".join(f"{count} {name}" for name, count in sorted(status.items())))
+    if status.get('failed'):
+        print("   ↪ Run with --resume to retry failed URLs once their backoff has elapsed.")
+    print(metrics.report())
+    return uploaded
+
+def confirm_lastmods(urls):
+    """Confirms the sitemap lastmods of uploaded `urls` in the main state file."""
+    conn = open_state()
+    try:
+        lastmods = LastmodStore(conn)
+        lastmods.confirm_all(urls)
+        lastmods.commit()
+    finally:
+        conn.close()
+
+def replay_details(concurrency=DEFAULT_CONCURRENCY, parse_workers=DEFAULT_PARSE_WORKERS, force_upload=False,
+                   shard_index=None, shard_count=None, sink='api'):
+    """Re-extracts the latest archived page of every URL with the current extractors, offline.
+
+    Records go through the same merge and content-hash check as a crawl, so
+    only books whose extracted data changed (e.g. after a parser fix) are
+    uploaded. The journal and the stored validators are left untouched.
+    """
+    print("🎞️ Replaying archived pages (no network)...")
+    if not sink_configured(sink):
+        return
+    from page_archive import ArchiveReader
+
+    reader = ArchiveReader()
+    urls = reader.urls()
+    sharded = shard_count is not None
+    if sharded:
+        urls = select_shard(urls, shard_index, shard_count)
+    print(f"📄 {len(urls)} archived URLs to re-extract (parse_workers={parse_workers}).")
+
+    conn = open_state(state_path(shard_index, shard_count)) if sharded else open_state()
+    hashes = UploadHashStore(conn)
+    metrics = Metrics(f"replay-{shard_name(shard_index, shard_count)}" if sharded else "replay")
+    started = time.monotonic()
+    try:
+        options = RunOptions(parse_workers, sink=sink, force_upload=force_upload, hashes=hashes,
+                             metrics=metrics, replay=reader)
+        savings = asyncio.run(run_details(urls, concurrency, 0, options))
+    finally:
+        conn.close()
+        reader.close()
+    metrics.write()
+    print(f"🏁 Re-extracted {len(urls)} pages in {time.monotonic() - started:.1f}s.")
+    print(f"🧮 {savings['unchanged']} books unchanged since their last upload (skipped).")
+    print(metrics.report())
+
+def sink_configured(sink):
+    if sink == 'api' and not API_SECRET:
+        print("❌ API_SECRET not found in .env")
+        return False
+    if sink == 'postgres' and not DATABASE_URL:
+        print("❌ DATABASE_URL not found in .env")
+        return False
+    return True
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bibliometro detail worker")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of page requests in flight")
+    parser.add_argument('--rps', type=float, default=DEFAULT_RPS,
+                        help="Starting requests per second per host, adapted to the site's health (0 = unlimited)")
+    parser.add_argument('--max-rps', type=float, default=None,
+                        help="Upper bound for the adaptive request rate (default: 4x --rps)")
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                        help="Processes used to parse HTML (default: one per CPU core)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue the previous run from its journal instead of starting over")
+    parser.add_argument('--full', action='store_true',
+                        help="Process the whole URL list instead of the master's delta")
+    parser.add_argument('--force-upload', action='store_true',
+                        help="Upload every parsed book even if its content hash did not change")
+    parser.add_argument('--no-conditional', action='store_true',
+                        help="Ignore stored ETag/Last-Modified values and download every page")
+    parser.add_argument('--shard-index', type=int, default=None,
+                        help="Only scrape the URLs of this shard (0-based, needs --shard-count)")
+    parser.add_argument('--shard-count', type=int, default=None,
+                        help="Number of shards the URL list is split into by a stable URL hash")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="Don't write this run's records to a compressed snapshot")
+    parser.add_argument('--search-index', action='store_true',
+                        help="Rebuild the offline trigram search index from the newest snapshots after the run")
+    parser.add_argument('--sink', choices=SINKS, default='api',
+                        help="Upload through the batch API (default) or COPY straight into Postgres "
+                             "via DATABASE_URL, for full reloads")
+    parser.add_argument('--archive', action='store_true',
+                        help="Store every downloaded page in the compressed page archive")
+    parser.add_argument('--replay', action='store_true',
+                        help="Re-extract the archived pages with the current extractors instead of crawling")
+    args = parser.parse_args()
+    if (args.shard_index is None) != (args.shard_count is None):
+        parser.error("--shard-index and --shard-count go together")
+    if args.shard_count is not None and not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard-index must be between 0 and --shard-count - 1")
+    if args.replay and (args.archive or args.resume):
+        parser.error("--replay reads the archive: it cannot be combined with --archive or --resume")
+    return args
 
 if __name__ == "__main__":
-    scrape_details()
+    args = parse_args()
+    if args.replay:
+        replay_details(concurrency=args.concurrency, parse_workers=args.parse_workers,
+                       force_upload=args.force_upload, shard_index=args.shard_index,
+                       shard_count=args.shard_count, sink=args.sink)
+    else:
+        scrape_details(concurrency=args.concurrency, rps=args.rps, conditional=not args.no_conditional,
+                       full=args.full, parse_workers=args.parse_workers,
+                       force_upload=args.force_upload, resume=args.resume, max_rps=args.max_rps,
+                       shard_index=args.shard_index, shard_count=args.shard_count, sink=args.sink,
+                       snapshot=not args.no_snapshot, search_index=args.search_index,
+                       archive=args.archive)
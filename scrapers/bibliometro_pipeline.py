@@ -0,0 +1,136 @@
+"""Master and worker in one run: detail scraping starts as soon as URLs are discovered.
+
+The master (sitemaps, then categories) runs in a background thread and
+every new book URL that the delta would include is handed to the detail
+worker through a queue, so the total time is about max(master, worker)
+instead of master + worker + the slack between two cron jobs. The
+master still writes bibliometro_final_urls.txt and the delta file at the
+end, exactly as when it runs alone; the delta is written once the worker
+is done, since both write to the same state file, and confirms the
+lastmods of the pages the worker uploaded.
+
+    python bibliometro_pipeline.py
+    python bibliometro_pipeline.py --full --concurrency 32
+"""
+import argparse
+import queue
+import threading
+import time
+from bibliometro_details import DEFAULT_CONCURRENCY, DEFAULT_PARSE_WORKERS, DEFAULT_RPS, SINKS, scrape_details
+from bibliometro_urls import BibliometroMasterScraper, logger
+from worker_state import open_state, LastmodStore
+
+
+class DeltaFilter:
+    """Decides while the master runs which URLs go to the worker, with the same rule as save_delta().
+
+    Called again when a known URL gets a new lastmod; each URL is sent at most once.
+    """
+
+    def __init__(self, full=False, full_sweep_days=7):
+        self.conn = open_state()
+        self.store = LastmodStore(self.conn)
+        self.everything = full or time.time() - self.store.last_full_sweep() >= full_sweep_days * 86400
+        self.sent = set()
+        self.lock = threading.Lock()  # called from the sitemap and category threads
+
+    def __call__(self, url, lastmod):
+        with self.lock:
+            if url in self.sent or not (self.everything or self.store.changed(url, lastmod)):
+                return False
+            self.sent.add(url)
+            return True
+
+    def close(self):
+        self.conn.close()
+
+
+def run_master(scraper, stream, failed, args):
+    """Runs the master's discovery, writes the URL list and ends the stream, even if it fails.
+
+    `failed` (a threading.Event) is set before the stream ends if discovery did not finish.
+    """
+    try:
+        scraper.get_sitemap_urls(rps=args.master_rps)
+        scraper.crawl_categories(workers=args.category_workers, rps=args.master_rps)
+        scraper.save()
+    except Exception as e:
+        logger.error(f"❌ Error en el master: {e}")
+        failed.set()
+    finally:
+        stream.put(None)
+
+
+def run_pipeline(args):
+    stream = queue.Queue()
+    master_failed = threading.Event()
+    wanted = DeltaFilter(args.full, args.full_sweep_days)
+    scraper = BibliometroMasterScraper(resume=args.resume, bloom_capacity=args.bloom_capacity)
+    # URLs restored from an interrupted master go first; the others, and restored ones
+    # whose lastmod changes during this run, as the master finds them
+    for url, lastmod in scraper.found_books.items():
+        if wanted(url, lastmod):
+            stream.put(url)
+    scraper.on_book = lambda url, lastmod: wanted(url, lastmod) and stream.put(url)
+
+    master = threading.Thread(target=run_master, args=(scraper, stream, master_failed, args),
+                              name="master", daemon=True)
+    started = time.monotonic()
+    master.start()
+    try:
+        uploaded = scrape_details(concurrency=args.concurrency, rps=args.rps, conditional=not args.no_conditional,
+                       full=args.full, parse_workers=args.parse_workers, force_upload=args.force_upload,
+                       max_rps=args.max_rps, sink=args.sink, snapshot=not args.no_snapshot,
+                       search_index=args.search_index, url_stream=stream, archive=args.archive,
+                       master_failed=master_failed)
+    finally:
+        master.join()
+        wanted.close()
+    if uploaded is None:
+        logger.warning("⚠️ El worker no corrió: los lastmod quedan sin confirmar y no se marca el barrido completo.")
+    scraper.save_delta(args.full_sweep_days, uploaded=uploaded)
+    scraper.metrics.inc("books_found_total", len(scraper.found_books))
+    scraper.metrics.set("frontier_bytes", scraper.found_books.memory_bytes())
+    scraper.metrics.write()
+    print(f"🚇 Pipeline finished in {time.monotonic() - started:.1f}s.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bibliometro master + detail worker, streamed")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of detail page requests in flight")
+    parser.add_argument('--rps', type=float, default=DEFAULT_RPS,
+                        help="Starting detail requests per second, adapted to the site's health (0 = unlimited)")
+    parser.add_argument('--max-rps', type=float, default=None,
+                        help="Upper bound for the adaptive detail request rate (default: 4x --rps)")
+    parser.add_argument('--parse-workers', type=int, default=DEFAULT_PARSE_WORKERS,
+                        help="Processes used to parse HTML (default: one per CPU core)")
+    parser.add_argument('--category-workers', type=int, default=8,
+                        help="Categories crawled in parallel by the master")
+    parser.add_argument('--master-rps', type=float, default=6.0,
+                        help="Starting requests per second of the master (sitemaps and listings)")
+    parser.add_argument('--full', action='store_true',
+                        help="Scrape every discovered URL instead of the new or modified ones")
+    parser.add_argument('--full-sweep-days', type=float, default=7,
+                        help="Days between full sweeps of the catalog")
+    parser.add_argument('--resume', action='store_true',
+                        help="Start the master from the URLs logged by an interrupted run")
+    parser.add_argument('--bloom-capacity', type=int, default=None,
+                        help="Bloom filter sized for N URLs in front of the master's frontier")
+    parser.add_argument('--force-upload', action='store_true',
+                        help="Upload every parsed book even if its content hash did not change")
+    parser.add_argument('--no-conditional', action='store_true',
+                        help="Ignore stored ETag/Last-Modified values and download every page")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="Don't write this run's records to a compressed snapshot")
+    parser.add_argument('--search-index', action='store_true',
+                        help="Rebuild the offline trigram search index after the run")
+    parser.add_argument('--sink', choices=SINKS, default='api',
+                        help="Upload through the batch API (default) or COPY straight into Postgres")
+    parser.add_argument('--archive', action='store_true',
+                        help="Store every downloaded page in the compressed page archive")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run_pipeline(parse_args())
@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import aiohttp
+import queue
+import time
+from book_extractor import extract_locations
+from bibliometro_details import API_BASE_URL, API_SECRET, HEADERS, MIN_RPS, fetch_page
+from metrics import Metrics
+from rate_limit import AdaptiveRateController
+from uploader import BatchUploader
+from worker_state import open_state, ValidatorStore, UploadHashStore, StockStore, same_stock
+
+# Configuration
+STOCK_API_URL = f"{API_BASE_URL}/api/books/stock"
+
+DEFAULT_BUDGET_SECONDS = 45 * 60  # leaves room inside an hourly schedule
+DEFAULT_CONCURRENCY = 16
+DEFAULT_RPS = 8.0
+
+
+async def run_stock_refresh(urls, concurrency, rps, budget, hashes, stock, validators=None, metrics=None,
+                            stock_validators=None):
+    """Refreshes branch stock for `urls`, in order, until `budget` seconds have passed.
+
+    Only the "Ubicación" block of each page is parsed. When the merged stock
+    of a book id changes, a stock-only update {id, locations} is uploaded to
+    /api/books/stock. Pages are fetched conditionally against the refresher's
+    own `stock_validators`, falling back to those of the last full scrape.
+    A page's new ETag/Last-Modified go to `stock_validators` once its stock
+    is in the API (unchanged, or its update uploaded); the full scrape's
+    validators are never touched, so the full worker still sees every other
+    field change.
+    """
+    controller = AdaptiveRateController(rps, concurrency, min_rps=MIN_RPS, metrics=metrics)
+    deadline = time.monotonic() + budget
+    counts = {"checked": 0, "not_modified": 0, "changed": 0, "unknown": 0, "failed": 0}
+    # book id -> (pending stock update, merged full record to mark as uploaded once it lands)
+    in_sync = {}
+    # book id -> {page url: validator entry} waiting for that id's update to land
+    pending_pages = {}
+    url_queue = asyncio.Queue()
+    for item in enumerate(urls):
+        url_queue.put_nowait(item)
+    loop = asyncio.get_running_loop()
+
+    def uploaded(books, ok):
+        # Runs on the event loop thread, scheduled by the uploader thread
+        if not ok:
+            return
+        done = []
+        for book in books:
+            if in_sync.get(book['id'], (None,))[0] is book:
+                done.append(in_sync.pop(book['id'])[1])
+            for page_url, entry in pending_pages.pop(book['id'], {}).items():
+                stock_validators.record(page_url, *entry)
+        hashes.mark_uploaded(done)
+        hashes.commit()
+        if stock_validators:
+            stock_validators.commit()
+
+    uploader = BatchUploader(
+        STOCK_API_URL, API_SECRET,
+        on_uploaded=lambda books, ok: loop.call_soon_threadsafe(uploaded, books, ok),
+        metrics=metrics
+    )
+
+    async def fetcher(session):
+        while time.monotonic() < deadline:
+            try:
+                i, url = url_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            if i % 50 == 0:
+                print(f"   [{i+1}/{len(urls)}] Checking stock: {url}")
+
+            conditional = None
+            if stock_validators:
+                conditional = stock_validators.conditional_headers(url)
+            if validators and not conditional:
+                conditional = validators.conditional_headers(url)
+            try:
+                status, body, response_headers = await fetch_page(session, controller, url, conditional, metrics)
+            except Exception as e:
+                print(f"      ⚠️ Failed to load page ({e})")
+                counts["failed"] += 1
+                continue
+
+            counts["checked"] += 1
+            if status == 304:
+                counts["not_modified"] += 1
+                stock.record(url, False)
+                continue
+            if status != 200:
+                counts["failed"] += 1
+                continue
+
+            started = time.perf_counter()
+            locations = extract_locations(body)
+            parse_seconds = time.perf_counter() - started
+            if metrics:
+                metrics.observe("parse_seconds", parse_seconds, phase="extract_locations")
+            entry = (response_headers.get('ETag'), response_headers.get('Last-Modified'), len(body), parse_seconds)
+            result = hashes.update_locations(url, locations)
+            if result is None:
+                counts["unknown"] += 1
+                continue
+            book_id, before, after = result
+            changed = not same_stock(before['locations'], after['locations'])
+            stock.record(url, changed)
+            if not changed:
+                if stock_validators:
+                    stock_validators.record(url, *entry)
+                continue
+            if stock_validators:
+                pending_pages.setdefault(book_id, {})[url] = entry
+
+            counts["changed"] += 1
+            update = {"id": book_id, "locations": after['locations']}
+            if book_id in in_sync or not hashes.changed(before):
+                # The API holds `before`, so after this update it holds `after`
+                in_sync[book_id] = (update, after)
+            try:
+                uploader.submit(update, block=False)
+            except queue.Full:
+                await asyncio.to_thread(uploader.submit, update)
+
+    timeout = aiohttp.ClientTimeout(total=30)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(headers=HEADERS, timeout=timeout, connector=connector) as session:
+        await asyncio.gather(*(fetcher(session) for _ in range(concurrency)))
+
+    await asyncio.to_thread(uploader.close)
+    await asyncio.sleep(0)  # let the last on_uploaded callbacks run
+    stock.commit()
+    hashes.commit()
+    if stock_validators:
+        stock_validators.commit()
+    counts["skipped"] = url_queue.qsize()
+    controller.record_metrics()
+    if metrics:
+        for name, count in counts.items():
+            metrics.set("stock_urls", count, result=name)
+    return counts
+
+
+def refresh_stock(budget=DEFAULT_BUDGET_SECONDS, concurrency=DEFAULT_CONCURRENCY, rps=DEFAULT_RPS,
+                  limit=None, conditional=True):
+    print("📦 Starting Bibliometro STOCK refresher (availability only)...")
+
+    if not API_SECRET:
+        print("❌ API_SECRET not found in .env")
+        return
+
+    conn = open_state()
+    try:
+        hashes = UploadHashStore(conn)
+        stock = StockStore(conn)
+        validators = ValidatorStore(conn) if conditional else None
+        stock_validators = ValidatorStore(conn, "stock_validators") if conditional else None
+        urls = stock.prioritized()
+        if limit:
+            urls = urls[:limit]
+        if not urls:
+            print("❌ No scraped books in the worker state yet. Run bibliometro_details.py first.")
+            return
+        print(f"📄 {len(urls)} URLs by priority (budget={budget:.0f}s, "
+              f"concurrency={concurrency}, rps={rps}).")
+
+        metrics = Metrics("stock")
+        started = time.monotonic()
+        counts = asyncio.run(run_stock_refresh(urls, concurrency, rps, budget, hashes, stock,
+                                               validators, metrics, stock_validators))
+    finally:
+        conn.close()
+    metrics.write()
+    print(f"🏁 Checked {counts['checked']} pages in {time.monotonic() - started:.1f}s: "
+          f"{counts['changed']} stock changes uploaded, {counts['not_modified']} not modified, "
+          f"{counts['failed']} failed.")
+    if counts['unknown']:
+        print(f"   ↪ {counts['unknown']} pages had no stored record and were ignored.")
+    if counts['skipped']:
+        print(f"   ⏱️ Budget exhausted: {counts['skipped']} lower-priority URLs left for the next run.")
+    print(metrics.report())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Bibliometro stock-only refresher")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help="Seconds after which no new page is requested")
+    parser.add_argument('--limit', type=int, default=None,
+                        help="Only check the N highest-priority URLs")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of page requests in flight")
+    parser.add_argument('--rps', type=float, default=DEFAULT_RPS,
+                        help="Starting requests per second per host, adapted to the site's health (0 = unlimited)")
+    parser.add_argument('--no-conditional', action='store_true',
+                        help="Ignore stored ETag/Last-Modified values and download every page")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    refresh_stock(budget=args.budget, concurrency=args.concurrency, rps=args.rps,
+                  limit=args.limit, conditional=not args.no_conditional)
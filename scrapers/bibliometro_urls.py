@@ -1,11 +1,28 @@
 import requests
-from bs4 import BeautifulSoup
-import xml.etree.ElementTree as ET
+import argparse
 import logging
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 import os
+from dotenv import load_dotenv
+from lxml import etree
+from book_extractor import parse_html
+from frontier import UrlFrontier
+from sitemaps import ingest_sitemaps
+from rate_limit import AdaptiveRateController, parse_retry_after
+from metrics import Metrics
+from worker_state import open_state, LastmodStore
+
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+# Sitio a recorrer (BIBLIOMETRO_BASE_URL permite apuntar al simulador local)
+BASE_URL = os.getenv('BIBLIOMETRO_BASE_URL', 'https://bibliometro.cl').rstrip('/')
+
+# Reintentos por página de listado ante 429/5xx o errores de conexión
+LISTING_RETRIES = 3
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 # --- Configuración de Logs ---
 logging.basicConfig(
@@ -18,52 +35,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger()
 
+# Un solo recorrido de lxml por los href de los <a> (strings simples, sin referencia al árbol)
+ANCHOR_HREFS = etree.XPath('//a/@href', smart_strings=False)
+
+def extract_book_links(html):
+    """Devuelve los href de /libros/ de una página de listado."""
+    doc = parse_html(html)
+    if doc is None:
+        return []
+    return [href for href in ANCHOR_HREFS(doc) if '/libros/' in href]
+
 class BibliometroMasterScraper:
-    def __init__(self):
-        self.base_url = "https://bibliometro.cl"
-        self.found_books = set()
+    def __init__(self, resume=False, bloom_capacity=None):
+        self.base_url = BASE_URL
+        self.metrics = Metrics("urls")
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
         # Save output in same directory
         self.output_file = os.path.join(os.path.dirname(__file__), "bibliometro_final_urls.txt")
+        # Only new/modified books since the previous run (read by the worker by default)
+        self.delta_file = os.path.join(os.path.dirname(__file__), "bibliometro_delta_urls.txt")
+        # Cada URL descubierta se anota aquí al instante: una caída no pierde la frontera
+        self.frontier_file = os.path.join(os.path.dirname(__file__), "bibliometro_frontier.log")
+        self.found_books = UrlFrontier(self.base_url, self.frontier_file, resume=resume,
+                                       bloom_capacity=bloom_capacity)
+        # Opcional: se llama con (url, lastmod) por cada libro nuevo, p. ej. para alimentar al worker
+        self.on_book = None
+        if resume:
+            logger.info(f"♻️ Reanudando: {self.found_books.restored} URLs recuperadas de {self.frontier_file}")
 
-    def get_sitemap_urls(self):
-        """Intenta extraer URLs directamente del mapa del sitio de WordPress"""
+    def add_book(self, url, lastmod=None):
+        """Agrega una URL de libro a la frontera. Devuelve True si es nueva (thread-safe).
+
+        `on_book(url, lastmod)` se llama para cada URL nueva y cada vez que cambia su lastmod.
+        """
+        new, changed = self.found_books.upsert(url, lastmod)
+        if (new or changed) and self.on_book:
+            self.on_book(url, lastmod)
+        return new
+
+    def get_sitemap_urls(self, workers=4, rps=6.0):
+        """Intenta extraer URLs directamente del mapa del sitio de WordPress.
+
+        Las descargas de sitemaps pasan por un controlador AIMD, como las del
+        barrido de categorías: `rps` es la tasa inicial y `workers` la concurrencia máxima.
+        """
         logger.info("--- ESTRATEGIA 1: INFILTRACIÓN VÍA SITEMAP ---")
         
         sitemaps = [
-            "https://bibliometro.cl/sitemap_index.xml",
-            "https://bibliometro.cl/wp-sitemap.xml", # Common in recent WP
-            "https://bibliometro.cl/post-sitemap.xml",
-            "https://bibliometro.cl/page-sitemap.xml"
+            f"{self.base_url}/sitemap_index.xml",
+            f"{self.base_url}/wp-sitemap.xml", # Common in recent WP
+            f"{self.base_url}/post-sitemap.xml",
+            f"{self.base_url}/page-sitemap.xml"
         ]
 
-        for sitemap_url in sitemaps:
-            logger.info(f"Probando sitemap: {sitemap_url}")
-            try:
-                response = self.session.get(sitemap_url, timeout=10)
-                if response.status_code == 200:
-                    try:
-                        root = ET.fromstring(response.content)
-                        count = 0
-                        # Try to handle namespaces loosely by checking tag string endings
-                        for elem in root.iter():
-                            if elem.tag.endswith('loc'):
-                                url = elem.text
-                                if url and '/libros/' in url:
-                                    self.found_books.add(url)
-                                    count += 1
-                                    
-                        logger.info(f"   -> ¡ÉXITO! Extraídas {count} URLs de libros de {sitemap_url}")
-                    except ET.ParseError:
-                        logger.warning(f"   -> {sitemap_url} no es un XML válido o legible.")
-            except Exception as e:
-                logger.warning(f"   -> Fallo al leer {sitemap_url}: {e}")
+        # Recorre índices y sub-sitemaps (.xml / .xml.gz) en paralelo, en streaming
+        controller = AdaptiveRateController(rps, workers, metrics=self.metrics)
+        counts = ingest_sitemaps(
+            self.session, sitemaps, self.add_book,
+            url_filter=lambda url: '/libros/' in url, workers=workers, metrics=self.metrics,
+            controller=controller
+        )
+        controller.record_metrics()
+        logger.info(f"   -> {len(counts)} sitemaps leídos, {sum(counts.values())} URLs de libros.")
+
+    def crawl_categories(self, workers=8, rps=6.0):
+        """Recorre las categorías estáticas como fallback, varias categorías en paralelo.
 
-    def crawl_categories(self):
-        """Recorre las categorías estáticas como fallback"""
+        Todas las categorías comparten un controlador AIMD: `rps` es la tasa inicial
+        y `workers` la concurrencia máxima; ambas se ajustan según la salud del sitio.
+        """
         logger.info("\n--- ESTRATEGIA 2: BARRIDO DE CATEGORÍAS ---")
         
         categorias = [
@@ -74,69 +117,159 @@ class BibliometroMasterScraper:
             "Sagas", "Salud física y mental"
         ]
 
-        for cat in categorias:
-            page = 1
-            empty_streak = 0
-            
-            while True:
-                # Limit scan depth for demo purposes - REMOVE LIMIT FOR PROD
-                # Limit scan depth for demo purposes - REMOVE LIMIT FOR PROD
-                # if page > 2: break 
-
-                if page == 1:
-                    url = f"https://bibliometro.cl/catalogo/?categoria={cat}"
-                else:
-                    url = f"https://bibliometro.cl/catalogo/page/{page}/?categoria={cat}"
+        controller = AdaptiveRateController(rps, workers, metrics=self.metrics)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda cat: self.crawl_category(cat, controller), categorias))
+        controller.record_metrics()
+
+    def crawl_category(self, cat, controller):
+        """Pagina una categoría hasta encontrar 2 páginas seguidas sin libros nuevos.
+
+        Un 429/5xx o un error de conexión reintenta la misma página; el
+        controlador ya aplicó la pausa (Retry-After) y redujo el ritmo.
+        """
+        page = 1
+        empty_streak = 0
+        retries = 0
 
-                logger.info(f"Escaneando '{cat}' - Pág {page}...")
-                
+        while True:
+            if page == 1:
+                url = f"{self.base_url}/catalogo/?categoria={cat}"
+            else:
+                url = f"{self.base_url}/catalogo/page/{page}/?categoria={cat}"
+
+            logger.info(f"Escaneando '{cat}' - Pág {page}...")
+
+            try:
+                controller.acquire_blocking(url)
+                started = time.perf_counter()
                 try:
                     response = self.session.get(url, timeout=15)
-                    if response.status_code != 200:
-                        break
-                    
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    links = soup.find_all('a', href=True)
-                    
-                    new_books_page = 0
-                    
-                    for link in links:
-                        href = link['href']
-                        if '/libros/' in href:
-                            full_url = urljoin(self.base_url, href).split('#')[0]
-                            if full_url not in self.found_books:
-                                self.found_books.add(full_url)
-                                new_books_page += 1
-                                # print(f"   + {full_url}")
-
-                    if new_books_page == 0:
-                        empty_streak += 1
-                    else:
-                        empty_streak = 0
-
-                    if empty_streak >= 2:
-                        logger.info(f"   -> Fin de '{cat}'.")
-                        break
-                        
-                    page += 1
-                    time.sleep(0.5)
-
-                except Exception as e:
-                    logger.error(f"Error en {url}: {e}")
+                except requests.RequestException:
+                    controller.release(url, None, time.perf_counter() - started)
+                    if retries >= LISTING_RETRIES:
+                        raise
+                    retries += 1
+                    self.metrics.inc("retries_total", reason="error")
+                    time.sleep(2 ** retries)
+                    continue
+                elapsed = time.perf_counter() - started
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                controller.release(url, response.status_code, elapsed, retry_after)
+                self.metrics.observe("fetch_seconds", elapsed, kind="listing")
+                self.metrics.inc("responses_total", status=response.status_code)
+                self.metrics.inc("fetch_bytes_total", len(response.content))
+                if response.status_code in RETRY_STATUSES and retries < LISTING_RETRIES:
+                    retries += 1
+                    self.metrics.inc("retries_total", reason=response.status_code)
+                    if retry_after is None and response.status_code != 429:
+                        time.sleep(2 ** retries)
+                    continue
+                if response.status_code != 200:
                     break
+                retries = 0
+
+                started = time.perf_counter()
+                links = extract_book_links(response.text)
+                self.metrics.observe("parse_seconds", time.perf_counter() - started, phase="extract_book_links")
+
+                new_books_page = 0
+                for href in links:
+                    full_url = urljoin(self.base_url, href).split('#')[0]
+                    if self.add_book(full_url):
+                        new_books_page += 1
+
+                if new_books_page == 0:
+                    empty_streak += 1
+                else:
+                    empty_streak = 0
+
+                if empty_streak >= 2:
+                    logger.info(f"   -> Fin de '{cat}'.")
+                    break
+
+                page += 1
+
+            except Exception as e:
+                logger.error(f"Error en {url}: {e}")
+                self.metrics.inc("responses_total", status="error")
+                break
 
     def save(self):
         logger.info(f"\n--- GUARDANDO {len(self.found_books)} LIBROS ---")
+        self.found_books.close()
         try:
-            with open(self.output_file, "w", encoding="utf-8") as f:
+            tmp = f"{self.output_file}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
                 for url in sorted(self.found_books):
                     f.write(url + "\n")
+            os.replace(tmp, self.output_file)
             logger.info(f"✅ Archivo guardado en: {self.output_file}")
         except Exception as e:
             logger.error(f"❌ Error al guardar archivo: {e}")
 
+    def save_delta(self, full_sweep_days=7, uploaded=()):
+        """Escribe solo los libros nuevos o modificados (según lastmod) desde la última subida del worker.
+
+        El lastmod visto queda pendiente hasta que el worker sube la página
+        (LastmodStore.confirm), así que un libro que falló o que el worker aún
+        no procesó vuelve a entrar en el siguiente delta.
+        Cada `full_sweep_days` días el delta incluye el catálogo completo como red de seguridad.
+
+        `uploaded`: URLs que el worker ya subió en esta corrida (pipeline); su
+        lastmod se confirma antes de calcular el delta y no vuelven a aparecer
+        en él. Con None (el worker no corrió) el barrido completo no se da por hecho.
+        """
+        conn = open_state()
+        store = LastmodStore(conn)
+        try:
+            full_sweep = time.time() - store.last_full_sweep() >= full_sweep_days * 86400
+            delta = []
+            books = sorted(self.found_books.items())
+            for url, lastmod in books:
+                store.observe(url, lastmod)
+            # Pages the worker already uploaded in this run don't go to the delta again
+            done = set(uploaded or ())
+            for url in done:
+                store.confirm(url)
+            for url, lastmod in books:
+                if url not in done and (full_sweep or store.changed(url, lastmod)):
+                    delta.append(url)
+
+            with open(self.delta_file, "w", encoding="utf-8") as f:
+                for url in delta:
+                    f.write(url + "\n")
+
+            if full_sweep and uploaded is not None:
+                store.mark_full_sweep()
+            store.commit()
+            label = "BARRIDO COMPLETO" if full_sweep else "DELTA"
+            logger.info(f"✅ {label}: {len(delta)} libros nuevos o modificados en {self.delta_file}")
+        except Exception as e:
+            logger.error(f"❌ Error al guardar delta: {e}")
+        finally:
+            conn.close()
+
 if __name__ == "__main__":
-    scraper = BibliometroMasterScraper()
-    scraper.get_sitemap_urls()
-    scraper.crawl_categories()
+    parser = argparse.ArgumentParser(description="Bibliometro URL master")
+    parser.add_argument('--category-workers', type=int, default=8,
+                        help="Categorías recorridas en paralelo")
+    parser.add_argument('--rps', type=float, default=6.0,
+                        help="Peticiones por segundo iniciales al sitio; el controlador AIMD las ajusta (0 = sin límite)")
+    parser.add_argument('--full-sweep-days', type=float, default=7,
+                        help="Días entre barridos completos del catálogo en el delta")
+    parser.add_argument('--resume', action='store_true',
+                        help="Parte de las URLs anotadas por una corrida interrumpida")
+    parser.add_argument('--bloom-capacity', type=int, default=None,
+                        help="Activa un filtro de Bloom dimensionado para N URLs como pre-chequeo de duplicados")
+    args = parser.parse_args()
+
+    scraper = BibliometroMasterScraper(resume=args.resume, bloom_capacity=args.bloom_capacity)
+    scraper.get_sitemap_urls(rps=args.rps)
+    scraper.crawl_categories(workers=args.category_workers, rps=args.rps)
     scraper.save()
+    scraper.save_delta(args.full_sweep_days)
+    scraper.metrics.inc("books_found_total", len(scraper.found_books))
+    scraper.metrics.set("frontier_bytes", scraper.found_books.memory_bytes())
+    scraper.metrics.write()
+    logger.info(scraper.metrics.report())
@@ -0,0 +1,336 @@
+import hashlib
+import html as html_lib
+import re
+import time
+import lxml.html
+from lxml import etree
+
+# Precompiled patterns
+PAGES_RE = re.compile(r'(\d+)')
+STOCK_RE = re.compile(r'^(.*?)\s*(\d+)$')
+CATEGORY_RE = re.compile("Tema - Materia:")
+SUMMARY_RE = re.compile("Resumen de libro")
+AUTHOR_LABEL_RE = re.compile(r'^autor(?:es|a)?\s*(?::|$)', re.IGNORECASE)
+HEADING_RE = re.compile(rb'<h([345])\b[^>]*>(.*?)</h\1\s*>', re.IGNORECASE | re.DOTALL)
+TAG_RE = re.compile(r'<[^>]+>')
+UL_OPEN_RE = re.compile(rb'<ul\b', re.IGNORECASE)
+UL_CLOSE_RE = re.compile(rb'</ul\s*>', re.IGNORECASE)
+
+CATEGORY_LABEL = "Tema - Materia:"
+UNKNOWN_AUTHOR = "Desconocido"
+
+HTML_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def generate_id(source, title):
+    """Generates a deterministic ID based on title."""
+    raw_id = f"{source}-{title}".lower().replace(' ', '-')
+    return hashlib.md5(raw_id.encode()).hexdigest()[:12]
+
+
+def parse_html(html):
+    """Builds the lxml tree for a page (str or UTF-8 bytes). Returns None for empty documents."""
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    try:
+        return lxml.html.document_fromstring(html, parser=HTML_PARSER)
+    except (etree.ParserError, ValueError):
+        return None
+
+
+def _text(el):
+    """Same as BeautifulSoup's get_text(strip=True)."""
+    return ''.join(s.strip() for s in el.itertext())
+
+
+def _string(el):
+    """Same as BeautifulSoup's `.string`: the text of an element with a single child."""
+    children = list(el)
+    if not children:
+        return el.text
+    if len(children) == 1 and not el.text and not children[0].tail:
+        return _string(children[0])
+    return None
+
+
+def _classes(el):
+    return (el.get('class') or '').split()
+
+
+def _next_sibling(el, tag):
+    for sib in el.itersiblings():
+        if sib.tag == tag:
+            return sib
+    return None
+
+
+def extract_fields(doc):
+    """Walks the tree once and returns the raw fields of a book page.
+
+    Every field (title, author, pages, image, availability, category,
+    description) is picked up in the same pass over the elements.
+    """
+    h1 = entry_h1 = h3_title = title_tag = None
+    cover = thumbnail = None
+    author = None
+    author_labels = []
+    pages = None
+    location_header = location_ul = None
+    category_li = category_strong = None
+    summary_h3 = None
+
+    for el in doc.iter():
+        tag = el.tag
+        if not isinstance(tag, str):
+            continue  # comments / processing instructions
+
+        if tag == 'h1':
+            if h1 is None:
+                h1 = el
+            if entry_h1 is None and 'entry-title' in _classes(el):
+                entry_h1 = el
+
+        elif tag in ('h3', 'h4', 'h5'):
+            txt = _text(el)
+            lower = txt.lower()
+            if location_header is None and "ubicación" in lower:
+                location_header = el
+            if tag == 'h4' and author is None and txt and \
+                    "ubicación" not in lower and "comentarios" not in lower:
+                author = txt
+            if tag == 'h3':
+                if h3_title is None:
+                    raw = ''.join(el.itertext())
+                    if "Resumen" not in raw and "Ubicación" not in raw:
+                        h3_title = el
+                if summary_h3 is None and 'tit-h3' in _classes(el):
+                    string = _string(el)
+                    if string and SUMMARY_RE.search(string):
+                        summary_h3 = el
+
+        elif tag == 'ul':
+            if location_ul is None and location_header is not None:
+                location_ul = el
+
+        elif tag == 'strong' or tag == 'b' or tag == 'span':
+            txt = _text(el)
+            if tag == 'strong':
+                if "páginas" in txt.lower():
+                    sib = el.tail
+                    if sib:
+                        match = PAGES_RE.search(sib)
+                        if match:
+                            pages = int(match.group(1))
+                if category_strong is None:
+                    string = _string(el)
+                    if string and CATEGORY_RE.search(string):
+                        category_strong = el
+            if AUTHOR_LABEL_RE.match(txt):
+                author_labels.append((el, txt))
+
+        elif tag == 'li':
+            if category_li is None and ' '.join(_classes(el)) == 'd-none d-sm-block':
+                string = _string(el)
+                if string and CATEGORY_RE.search(string):
+                    category_li = el
+
+        elif tag == 'div':
+            if cover is None and 'book-cover' in _classes(el):
+                cover = el
+
+        elif tag == 'img':
+            if thumbnail is None and 'attachment-post-thumbnail' in _classes(el):
+                thumbnail = el
+
+        elif tag == 'title':
+            if title_tag is None:
+                title_tag = el
+
+    # Title: h1.entry-title, any h1, first non-section h3, then <title>
+    title = None
+    heading = entry_h1 if entry_h1 is not None else h1
+    if heading is None:
+        heading = h3_title
+    if heading is not None:
+        title = _text(heading)
+    elif title_tag is not None:
+        raw_title = _text(title_tag)
+        if " - Bibliometro" in raw_title:
+            title = raw_title.replace(" - Bibliometro", "").strip()
+
+    # Image
+    image_url = None
+    if cover is not None:
+        img = next(cover.iter('img'), None)
+        if img is not None:
+            image_url = img.get('src')
+    elif thumbnail is not None:
+        image_url = thumbnail.get('src')
+
+    # Author: first plain h4, else a labelled "Autor: ..." element
+    if author is None:
+        for el, txt in author_labels:
+            if ":" in txt:
+                value = txt.split(":", 1)[1].strip()
+            else:
+                value = (el.tail or '').strip()
+            if value:
+                author = value
+                break
+
+    # Availability
+    locations = []
+    if location_ul is not None:
+        locations = _locations(location_ul)
+
+    # Category
+    category = None
+    li = category_li
+    if li is None and category_strong is not None:
+        li = category_strong.getparent()
+    if li is not None:
+        text = _text(li)
+        if CATEGORY_LABEL in text:
+            category = text.replace(CATEGORY_LABEL, "").strip()
+
+    # Description
+    description = None
+    if summary_h3 is not None:
+        p = _next_sibling(summary_h3, 'p')
+        if p is not None:
+            description = _text(p)
+
+    return {
+        "title": title,
+        "author": author or UNKNOWN_AUTHOR,
+        "pages": pages,
+        "imageUrl": image_url,
+        "locations": locations,
+        "category": category,
+        "description": description,
+    }
+
+
+def _locations(ul):
+    """Branch/stock pairs with stock > 0 from the "Ubicación de este libro" list."""
+    locations = []
+    for li in ul.iter('li'):
+        text_content = _text(li).replace('\xa0', ' ').strip()
+        match = STOCK_RE.search(text_content)
+        if match:
+            branch_name = match.group(1).strip()
+            stock = int(match.group(2))
+            if stock > 0:
+                locations.append({"branch": branch_name, "stock": stock})
+    return locations
+
+
+def extract_locations(html):
+    """Branch/stock pairs of a page without building the whole tree.
+
+    Finds the first h3/h4/h5 mentioning "Ubicación" with a regex, then parses
+    only the <ul> that follows it. Same result as get_availability() for a
+    fraction of the cost; used by the stock-only refresher.
+    """
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+    for match in HEADING_RE.finditer(html):
+        heading = html_lib.unescape(TAG_RE.sub('', match.group(2).decode('utf-8', 'replace')))
+        if "ubicación" in heading.lower():
+            break
+    else:
+        return []
+
+    start = UL_OPEN_RE.search(html, match.end())
+    end = UL_CLOSE_RE.search(html, start.end()) if start else None
+    if end is None:
+        return []
+    try:
+        ul = lxml.html.fragment_fromstring(html[start.start():end.end()], parser=HTML_PARSER)
+    except (etree.ParserError, ValueError):
+        return []
+    return _locations(ul)
+
+
+def build_book(fields, url):
+    """Turns extracted fields into the book_data dict sent to /api/books/batch."""
+    title = fields["title"]
+    category = fields["category"]
+    return {
+        "id": f"bib_{generate_id('bibliometro', title)}",
+        "title": title[:255],
+        "author": fields["author"][:255],
+        "pages": fields["pages"],
+        "difficulty": 3,
+        "source": "bibliometro",
+        "url": url,
+        "tags": ["bibliometro"],
+        "imageUrl": fields["imageUrl"],
+        "locations": fields["locations"],
+        "category": category[:255] if category else None,
+        "description": fields["description"],
+        "summary": fields["description"]
+    }
+
+
+def extract_book(html, url):
+    """Parses a book page once and returns its book_data, or None if it has no title."""
+    doc = parse_html(html)
+    if doc is None:
+        return None
+    fields = extract_fields(doc)
+    if fields["title"] is None:
+        return None
+    return build_book(fields, url)
+
+
+def _fields(page):
+    """Fields of a page given as html, a parsed tree or the dict returned by extract_fields().
+
+    Callers reading several fields should pass that dict, so the page is
+    parsed and walked only once.
+    """
+    if isinstance(page, dict):
+        return page
+    doc = parse_html(page) if isinstance(page, (str, bytes)) else page
+    return extract_fields(doc) if doc is not None else None
+
+
+def get_availability(page):
+    """Extracts branch availability from a page (html, parsed tree or extract_fields() dict)."""
+    fields = _fields(page)
+    return fields["locations"] if fields is not None else []
+
+
+def get_category(page):
+    """Extracts the "Tema - Materia" category from a page (html, parsed tree or extract_fields() dict)."""
+    fields = _fields(page)
+    return fields["category"] if fields is not None else None
+
+
+def get_description(page):
+    """Extracts the 'Resumen de libro' description from a page (html, parsed tree or extract_fields() dict)."""
+    fields = _fields(page)
+    return fields["description"] if fields is not None else None
+
+
+def timed_extract(html, url):
+    """extract_book() plus the seconds spent in each phase; the unit of work for parser processes.
+
+    Phases are parse_html (tree building), extract_fields (the single pass
+    collecting every field) and build_book.
+    """
+    timings = {}
+    started = time.perf_counter()
+    doc = parse_html(html)
+    timings["parse_html"] = time.perf_counter() - started
+    book = None
+    if doc is not None:
+        started = time.perf_counter()
+        fields = extract_fields(doc)
+        timings["extract_fields"] = time.perf_counter() - started
+        if fields["title"] is not None:
+            started = time.perf_counter()
+            book = build_book(fields, url)
+            timings["build_book"] = time.perf_counter() - started
+    return book, timings
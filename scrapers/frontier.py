@@ -0,0 +1,211 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from array import array
+
+FLUSH_SECONDS = 1.0   # the append log is flushed at least this often
+MAX_LOAD = 0.5        # fingerprint table is doubled beyond this fill ratio
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 128-bit digests (Kirsch-Mitzenmacher double hashing)."""
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, h1, h2):
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, h1, h2):
+        for pos in self._positions(h1, h2):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        h1, h2 = digest
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(h1, h2))
+
+
+class UrlFrontier:
+    """Set of discovered book URLs that keeps only what differs between them.
+
+    URLs of the form <base_url>/libros/<slug>/ are stored as their slug,
+    anything else whole, as UTF-8 in one bytearray with an offsets array.
+    Lastmods are kept verbatim the same way: UTF-8 in a second bytearray,
+    with a start and a size per entry (size 0 = only seen in a listing).
+    De-duplication uses an open-addressing table of 64-bit fingerprints
+    (array-backed, ~24 bytes per URL), optionally behind a Bloom filter that
+    answers "new" without probing the table. Iteration is in discovery order.
+
+    With `log_path`, every new URL (and every new lastmod) is appended to
+    that file as "url<TAB>lastmod" as soon as it is added, so a crash loses
+    at most FLUSH_SECONDS of discoveries. With `resume` the frontier starts
+    from the URLs already in that log instead of truncating it.
+    """
+
+    def __init__(self, base_url, log_path=None, resume=False, bloom_capacity=None, bloom_error=0.01):
+        self.prefix = f"{base_url.rstrip('/')}/libros/"
+        self.blob = bytearray()
+        self.offsets = array('I', [0])
+        self.lastmod_blob = bytearray()
+        self.lastmod_starts = array('I')
+        self.lastmod_sizes = array('H')
+        self.keys = array('Q', bytes(8 * 1024))
+        self.slots = array('I', bytes(4 * 1024))
+        self.bloom = BloomFilter(bloom_capacity, bloom_error) if bloom_capacity else None
+        self.lock = threading.Lock()
+        self.log = None
+        self.last_flush = 0.0
+        self.restored = 0
+        if log_path:
+            if resume and os.path.exists(log_path):
+                self.restored = self._replay(log_path)
+            self.log = open(log_path, 'a' if resume else 'w', encoding='utf-8')
+
+    # --- entries -----------------------------------------------------------
+
+    def _entry(self, url):
+        if url.startswith(self.prefix):
+            slug = url[len(self.prefix):]
+            if slug.endswith('/') and '/' not in slug[:-1] and '?' not in slug:
+                return slug[:-1]
+        return url
+
+    def _url(self, index):
+        entry = self.blob[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+        return entry if '://' in entry else f"{self.prefix}{entry}/"
+
+    def _lastmod(self, index):
+        size = self.lastmod_sizes[index]
+        if not size:
+            return None
+        start = self.lastmod_starts[index]
+        return self.lastmod_blob[start:start + size].decode('utf-8')
+
+    def _set_lastmod(self, index, lastmod):
+        """Stores the lastmod of entry `index`, in place when it has the same length as the old one."""
+        data = lastmod.encode('utf-8') if lastmod else b''
+        if index == len(self.lastmod_sizes):
+            self.lastmod_starts.append(0)
+            self.lastmod_sizes.append(0)
+        if data and len(data) == self.lastmod_sizes[index]:
+            start = self.lastmod_starts[index]
+            self.lastmod_blob[start:start + len(data)] = data
+            return
+        self.lastmod_starts[index] = len(self.lastmod_blob) if data else 0
+        self.lastmod_sizes[index] = len(data)
+        self.lastmod_blob += data
+
+    def __len__(self):
+        return len(self.lastmod_sizes)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._url(index)
+
+    def items(self):
+        """Yields (url, lastmod) in discovery order."""
+        for index in range(len(self)):
+            yield self._url(index), self._lastmod(index)
+
+    def memory_bytes(self):
+        """Approximate memory held by the frontier's arrays."""
+        return (len(self.blob) + self.offsets.itemsize * len(self.offsets)
+                + self.keys.itemsize * len(self.keys) + self.slots.itemsize * len(self.slots)
+                + len(self.lastmod_blob) + self.lastmod_starts.itemsize * len(self.lastmod_starts)
+                + self.lastmod_sizes.itemsize * len(self.lastmod_sizes)
+                + (len(self.bloom.bits) if self.bloom else 0))
+
+    # --- fingerprint table -------------------------------------------------
+
+    def _find(self, key):
+        """Table position holding `key`, or the empty position where it would go."""
+        mask = len(self.keys) - 1
+        pos = key & mask
+        while self.keys[pos] and self.keys[pos] != key:
+            pos = (pos + 1) & mask
+        return pos
+
+    def _grow(self):
+        keys, slots = self.keys, self.slots
+        self.keys = array('Q', bytes(16 * len(keys)))
+        self.slots = array('I', bytes(8 * len(slots)))
+        for key, slot in zip(keys, slots):
+            if key:
+                pos = self._find(key)
+                self.keys[pos] = key
+                self.slots[pos] = slot
+
+    # --- public API --------------------------------------------------------
+
+    def add(self, url, lastmod=None):
+        """Adds `url`. Returns True if it was not in the frontier yet (thread-safe)."""
+        return self.upsert(url, lastmod)[0]
+
+    def upsert(self, url, lastmod=None):
+        """Adds `url` or updates its lastmod. Returns (new, lastmod changed) (thread-safe)."""
+        entry = self._entry(url).encode('utf-8')
+        digest = hashlib.blake2b(entry, digest_size=16).digest()
+        key = int.from_bytes(digest[:8], 'big') | 1  # 0 marks an empty slot
+        with self.lock:
+            if self.bloom is None or (key, int.from_bytes(digest[8:], 'big')) in self.bloom:
+                pos = self._find(key)
+                if self.keys[pos]:
+                    index = self.slots[pos]
+                    if lastmod and lastmod != self._lastmod(index):
+                        self._set_lastmod(index, lastmod)
+                        self._append(url, lastmod)
+                        return False, True
+                    return False, False
+            else:
+                pos = self._find(key)  # definitely new: only look for the free slot
+            index = len(self)
+            self.keys[pos] = key
+            self.slots[pos] = index
+            self.blob += entry
+            self.offsets.append(len(self.blob))
+            self._set_lastmod(index, lastmod)
+            if self.bloom is not None:
+                self.bloom.add(key, int.from_bytes(digest[8:], 'big'))
+            if len(self) > MAX_LOAD * len(self.keys):
+                self._grow()
+            self._append(url, lastmod)
+            return True, False
+
+    def __contains__(self, url):
+        entry = self._entry(url).encode('utf-8')
+        key = int.from_bytes(hashlib.blake2b(entry, digest_size=16).digest()[:8], 'big') | 1
+        with self.lock:
+            return bool(self.keys[self._find(key)])
+
+    def _append(self, url, lastmod):
+        if not self.log:
+            return
+        self.log.write(f"{url}\t{lastmod or ''}\n")
+        now = time.monotonic()
+        if now - self.last_flush >= FLUSH_SECONDS:
+            self.log.flush()
+            self.last_flush = now
+
+    def _replay(self, path):
+        """Re-adds the URLs of an append log and cuts off a torn last line. Returns lines read."""
+        read = complete = 0
+        with open(path, 'rb+') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # the crash interrupted this write
+                complete += len(line)
+                url, _, lastmod = line.decode('utf-8').rstrip('\n').partition('\t')
+                if url:
+                    self.add(url, lastmod or None)
+                    read += 1
+            f.truncate(complete)
+        return read
+
+    def close(self):
+        if self.log:
+            self.log.close()
+            self.log = None
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Where runs leave <job>.prom (node_exporter textfile collector) and <job>.json
+METRICS_DIR = os.getenv('SCRAPER_METRICS_DIR', os.path.join(os.path.dirname(__file__), "metrics"))
+PREFIX = "bookwise_scraper_"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, Prometheus style."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate of the q-quantile, interpolated inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            if seen + count >= rank and count:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return lower
+
+
+def _round(value):
+    return round(value, 6) if value is not None else None
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    """Counters, gauges and latency histograms for one scraper run (thread-safe).
+
+    Every series gets a `job` label, so several scrapers can share one
+    textfile directory.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.started = time.monotonic()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def to_prometheus(self):
+        job = (("job", self.job),)
+        lines = []
+        with self.lock:
+            for kind, series in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                    for (key, labels), value in sorted(series.items()):
+                        if key == name:
+                            lines.append(f"{PREFIX}{name}{_format_labels(job + labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (key, labels), histogram in sorted(self.histograms.items()):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        le = (("le", bound),)
+                        lines.append(f"{PREFIX}{name}_bucket{_format_labels(job + labels, le)} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{_format_labels(job + labels)} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{_format_labels(job + labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """JSON-friendly view: counters, gauges and count/mean/p50/p95/p99 per histogram."""
+        def key(name, labels):
+            return name + _format_labels(labels)
+
+        with self.lock:
+            histograms = {}
+            for (name, labels), h in sorted(self.histograms.items()):
+                histograms[key(name, labels)] = {
+                    "count": h.count,
+                    "sum": round(h.sum, 6),
+                    "mean": round(h.sum / h.count, 6) if h.count else None,
+                    **{f"p{int(q * 100)}": _round(h.quantile(q)) for q in (0.5, 0.95, 0.99)},
+                }
+            return {
+                "job": self.job,
+                "wall_seconds": round(time.monotonic() - self.started, 3),
+                "counters": {key(n, l): v for (n, l), v in sorted(self.counters.items())},
+                "gauges": {key(n, l): v for (n, l), v in sorted(self.gauges.items())},
+                "histograms": histograms,
+            }
+
+    def write(self, directory=METRICS_DIR):
+        """Writes <job>.prom and <job>.json atomically. Returns the JSON summary."""
+        os.makedirs(directory, exist_ok=True)
+        self.set("run_seconds", round(time.monotonic() - self.started, 3))
+        self.set("last_run_timestamp_seconds", int(time.time()))
+        summary = self.summary()
+        for ext, content in (("prom", self.to_prometheus()),
+                             ("json", json.dumps(summary, indent=2, ensure_ascii=False))):
+            path = os.path.join(directory, f"{self.job}.{ext}")
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        return summary
+
+    def report(self):
+        """One-line-per-stage digest for the cron log."""
+        summary = self.summary()
+        lines = [f"📊 Metrics ({self.job}, {summary['wall_seconds']:.1f}s):"]
+        for name, h in summary["histograms"].items():
+            if name.endswith("_seconds") or "_seconds{" in name:
+                lines.append(f"   {name}: n={h['count']} mean={h['mean'] * 1000:.1f}ms "
+                             f"p95={h['p95'] * 1000:.1f}ms")
+            else:
+                lines.append(f"   {name}: n={h['count']} mean={h['mean']:.1f}")
+        for name, value in summary["counters"].items():
+            lines.append(f"   {name}: {value}")
+        return "\n".join(lines)
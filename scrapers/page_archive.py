@@ -0,0 +1,234 @@
+"""Content-addressed archive of the raw pages fetched by the detail worker.
+
+With --archive, every downloaded page is stored once per distinct body
+under SCRAPER_ARCHIVE_DIR:
+
+    pages-<run>.zst    pack of independently compressed bodies (.gz when zstandard is not installed)
+    index.sqlite       blobs(digest -> pack, offset, length)  fetches(url, fetched_at -> digest)
+
+A page that did not change since an earlier fetch only adds a row to
+`fetches`, so nightly runs grow the archive by what actually changed.
+`bibliometro_details.py --replay` runs the current extractors over the
+latest archived copy of every URL without touching the network.
+
+    python page_archive.py stats
+    python page_archive.py show <url> > page.html
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:  # gzip fallback
+    zstandard = None
+
+ARCHIVE_DIR = os.getenv('SCRAPER_ARCHIVE_DIR', os.path.join(os.path.dirname(__file__), "archive"))
+COMMIT_EVERY = 200          # index rows per SQLite commit
+QUEUE_SIZE = 256            # pages waiting for the writer thread
+
+
+def _codec():
+    return "zst" if zstandard else "gz"
+
+
+def _compress(data, codec):
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, codec):
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def digest(body):
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+def open_index(directory=ARCHIVE_DIR):
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            digest BLOB PRIMARY KEY,
+            pack TEXT NOT NULL,
+            offset INTEGER NOT NULL,
+            length INTEGER NOT NULL,
+            size INTEGER NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetches (
+            url TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            digest BLOB NOT NULL,
+            PRIMARY KEY (url, fetched_at)
+        )
+    """)
+    conn.commit()
+    return conn
+
+
+class PageArchive:
+    """Background writer: submit() queues a page, one thread compresses and appends it.
+
+    Bodies already in the archive (same digest) are not stored again. A
+    blob's index row is only written after its bytes reached the pack, so
+    a crash leaves at most unreferenced bytes at the end of a pack.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, metrics=None):
+        self.directory = directory
+        self.metrics = metrics
+        self.conn = open_index(directory)
+        self.codec = _codec()
+        self.pack = f"pages-{time.strftime('%Y%m%dT%H%M%S')}.{self.codec}"
+        self.file = open(os.path.join(directory, self.pack), 'ab')
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.writes = 0
+        self.stats = {"pages": 0, "stored": 0, "bytes": 0, "compressed_bytes": 0}
+        self.thread = threading.Thread(target=self._run, name="page-archive", daemon=True)
+        self.thread.start()
+
+    def submit(self, url, body, block=True):
+        """Queues one fetched page. Raises queue.Full if `block` is False and the queue is full."""
+        self.queue.put((url, time.time(), body), block=block)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        self.conn.commit()
+        self.conn.close()
+        if not self.stats["stored"]:
+            os.remove(os.path.join(self.directory, self.pack))
+        return self.stats
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            url, fetched_at, body = item
+            try:
+                self._store(url, fetched_at, body)
+            except Exception as e:
+                print(f"      ⚠️ Could not archive {url}: {e}")
+
+    def _store(self, url, fetched_at, body):
+        key = digest(body)
+        self.stats["pages"] += 1
+        if self.conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (key,)).fetchone() is None:
+            data = _compress(body, self.codec)
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+            self.conn.execute("INSERT INTO blobs VALUES (?, ?, ?, ?, ?)",
+                              (key, self.pack, offset, len(data), len(body)))
+            self.stats["stored"] += 1
+            self.stats["bytes"] += len(body)
+            self.stats["compressed_bytes"] += len(data)
+            if self.metrics:
+                self.metrics.inc("archive_bytes_total", len(data))
+        self.conn.execute("INSERT OR REPLACE INTO fetches VALUES (?, ?, ?)", (url, fetched_at, key))
+        if self.metrics:
+            self.metrics.inc("archive_pages_total")
+        self.writes += 1
+        if self.writes % COMMIT_EVERY == 0:
+            self.conn.commit()
+
+
+class ArchiveReader:
+    """Latest archived body of every URL, read straight from the packs (thread-safe)."""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        conn = open_index(directory)
+        try:
+            # url -> (pack, offset, length) of its most recent fetch
+            self.latest = {url: (pack, offset, length) for url, pack, offset, length in conn.execute("""
+                SELECT f.url, b.pack, b.offset, b.length
+                FROM fetches f
+                JOIN (SELECT url, MAX(fetched_at) AS fetched_at FROM fetches GROUP BY url) last
+                  ON last.url = f.url AND last.fetched_at = f.fetched_at
+                JOIN blobs b ON b.digest = f.digest
+            """)}
+        finally:
+            conn.close()
+        self.fds = {}
+        self.lock = threading.Lock()
+
+    def urls(self):
+        return sorted(self.latest)
+
+    def _fd(self, pack):
+        with self.lock:
+            fd = self.fds.get(pack)
+            if fd is None:
+                fd = self.fds[pack] = os.open(os.path.join(self.directory, pack), os.O_RDONLY)
+            return fd
+
+    def read(self, url):
+        """The latest archived body of `url`, or None."""
+        entry = self.latest.get(url)
+        if entry is None:
+            return None
+        pack, offset, length = entry
+        return _decompress(os.pread(self._fd(pack), length, offset), pack.rsplit('.', 1)[1])
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+
+def print_stats(directory=ARCHIVE_DIR):
+    conn = open_index(directory)
+    try:
+        fetches, urls, first, last = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT url), MIN(fetched_at), MAX(fetched_at) FROM fetches").fetchone()
+        blobs, size, stored = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(length), 0) FROM blobs").fetchone()
+    finally:
+        conn.close()
+    print(f"🗄️ {urls} URLs, {fetches} fetches, {blobs} distinct pages in {directory}")
+    if fetches:
+        print(f"   {time.strftime('%Y-%m-%d %H:%M', time.localtime(first))} -> "
+              f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(last))}")
+        print(f"   {size / 1e6:.1f} MB of HTML stored as {stored / 1e6:.1f} MB "
+              f"({size / max(stored, 1):.1f}x compression)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Raw page archive of the detail worker")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Archive size and contents")
+    show = sub.add_parser("show", help="Print the latest archived body of a URL")
+    show.add_argument('url')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "stats":
+        print_stats()
+    else:
+        reader = ArchiveReader()
+        body = reader.read(args.url)
+        if body is None:
+            print(f"❌ Not archived: {args.url}", file=sys.stderr)
+            sys.exit(1)
+        sys.stdout.buffer.write(body)
@@ -0,0 +1,185 @@
+import io
+import json
+import os
+import queue
+import threading
+import time
+from dotenv import load_dotenv
+from metrics import SIZE_BUCKETS
+
+try:
+    import psycopg2
+except ImportError:  # only needed for --sink postgres
+    psycopg2 = None
+
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+COPY_BATCH = 5000           # books per COPY + merge transaction
+LINGER_SECONDS = 2.0        # merge a partial batch if nothing arrives for this long
+SHUTDOWN_RETRIES = 3
+
+# Same semantics as Book.bulkCreate(..., { updateOnDuplicate }) in batchCreateBooks:
+# every column is written on insert, only these are overwritten on conflict.
+INSERT_COLUMNS = ['id', 'title', 'author', 'pages', 'difficulty', 'source', 'url', 'tags',
+                  'imageUrl', 'locations', 'category', 'description', 'summary']
+UPDATE_ON_DUPLICATE = ['title', 'author', 'url', 'imageUrl', 'tags', 'locations', 'category',
+                       'description', 'summary', 'updatedAt']
+
+
+def _quote(column):
+    return f'"{column}"'
+
+
+STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS books_staging (
+        seq BIGINT,
+        doc JSONB
+    ) ON COMMIT DELETE ROWS
+"""
+
+# jsonb_populate_record maps book_data keys onto the books columns (tags -> text[]);
+# DISTINCT ON keeps the last record of an id, like the per-batch dedup of BatchUploader.
+MERGE_SQL = f"""
+    INSERT INTO books ({', '.join(map(_quote, INSERT_COLUMNS))}, "createdAt", "updatedAt")
+    SELECT {', '.join(f'r.{_quote(c)}' for c in INSERT_COLUMNS)}, now(), now()
+    FROM (
+        SELECT DISTINCT ON (r.id) r.*
+        FROM books_staging s
+        CROSS JOIN LATERAL jsonb_populate_record(NULL::books, s.doc) r
+        ORDER BY r.id, s.seq DESC
+    ) r
+    ON CONFLICT (id) DO UPDATE SET
+        {', '.join(f'{_quote(c)} = EXCLUDED.{_quote(c)}' for c in UPDATE_ON_DUPLICATE)}
+"""
+
+
+def copy_escape(text):
+    """Escapes one value for COPY's text format (JSON never holds raw tabs/newlines)."""
+    return text.replace('\\', '\\\\').replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+
+
+class CopyUploader:
+    """Drop-in alternative to BatchUploader that writes straight to Postgres.
+
+    Books are buffered by a background thread and loaded COPY_BATCH at a
+    time: one COPY into a temporary staging table and one set-based
+    INSERT ... ON CONFLICT into `books`, in a single transaction. Failed
+    batches are kept and retried on close(), and `on_uploaded(books, ok)` is
+    called after every attempt, exactly like BatchUploader.
+    """
+
+    def __init__(self, database_url=DATABASE_URL, on_uploaded=None, queue_size=COPY_BATCH * 2,
+                 metrics=None):
+        if psycopg2 is None:
+            raise RuntimeError("psycopg2 is not installed (pip install psycopg2-binary)")
+        if not database_url:
+            raise RuntimeError("DATABASE_URL not found in .env")
+        self.database_url = database_url
+        self.on_uploaded = on_uploaded
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.failed = []
+        self.seq = 0
+        self.stats = {"batches": 0, "books": 0, "bytes": 0, "gzip_bytes": 0, "failed": 0}
+        self.conn = None
+
+        self.thread = threading.Thread(target=self._run, name="copy-uploader", daemon=True)
+        self.thread.start()
+
+    def submit(self, book, block=True):
+        """Queues one book_data. Raises queue.Full if `block` is False and the queue is full."""
+        self.queue.put(book, block=block)
+
+    def close(self):
+        """Loads the last partial batch, retries failed batches and closes the connection."""
+        self.queue.put(None)
+        self.thread.join()
+
+        for attempt in range(SHUTDOWN_RETRIES):
+            if not self.failed:
+                break
+            time.sleep(2 ** attempt)
+            pending, self.failed = self.failed, []
+            if self.metrics:
+                self.metrics.inc("retries_total", len(pending), reason="upload")
+            print(f"   🔁 Retrying {len(pending)} failed COPY batches (attempt {attempt + 1}/{SHUTDOWN_RETRIES})...")
+            for books in pending:
+                self._send(books)
+
+        if self.failed:
+            lost = sum(len(books) for books in self.failed)
+            print(f"   ❌ {len(self.failed)} batches ({lost} books) could not be loaded.")
+        if self.conn is not None:
+            self.conn.close()
+        return not self.failed
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                book = self.queue.get(timeout=LINGER_SECONDS)
+            except queue.Empty:
+                if batch:
+                    self._send(batch)
+                    batch = []
+                continue
+
+            if book is None:
+                break
+            batch.append(book)
+            if len(batch) >= COPY_BATCH:
+                self._send(batch)
+                batch = []
+
+        if batch:
+            self._send(batch)
+
+    def _connection(self):
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(self.database_url)
+        return self.conn
+
+    def _send(self, books):
+        buffer = io.StringIO()
+        for book in books:
+            self.seq += 1
+            buffer.write(f"{self.seq}\t{copy_escape(json.dumps(book, ensure_ascii=False))}\n")
+        payload = buffer.getvalue()
+        buffer.seek(0)
+
+        ok = False
+        started = time.monotonic()
+        try:
+            conn = self._connection()
+            with conn, conn.cursor() as cur:  # one transaction: COPY + merge
+                cur.execute(STAGING_SQL)
+                cur.copy_expert("COPY books_staging (seq, doc) FROM STDIN", buffer)
+                cur.execute(MERGE_SQL)
+                merged = cur.rowcount
+            ok = True
+            print(f"   🐘 COPY loaded {len(books)} books ({merged} rows merged, "
+                  f"{len(payload) / 1000:.0f} KB, {time.monotonic() - started:.2f}s).")
+        except Exception as e:
+            print(f"   ❌ Postgres load failed: {e}")
+            if self.conn is not None and not self.conn.closed:
+                self.conn.close()
+        elapsed = time.monotonic() - started
+
+        if self.metrics:
+            self.metrics.observe("upload_seconds", elapsed)
+            self.metrics.observe("upload_batch_size", len(books), buckets=SIZE_BUCKETS + (2500, 5000))
+            self.metrics.inc("upload_bytes_total", len(payload))
+            self.metrics.inc("uploads_total", result="ok" if ok else "failed")
+
+        if ok:
+            self.stats["batches"] += 1
+            self.stats["books"] += len(books)
+            self.stats["bytes"] += len(payload)
+        else:
+            self.stats["failed"] += 1
+            self.failed.append(books)
+
+        if self.on_uploaded:
+            self.on_uploaded(books, ok)
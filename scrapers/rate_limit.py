@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+THROTTLE_STATUSES = {429, 502, 503, 504}  # "slow down" answers
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class _HostState:
+    def __init__(self, rps, concurrency):
+        self.rps = rps
+        self.concurrency = float(concurrency)
+        self.in_flight = 0
+        self.next_slot = 0.0
+        self.blocked_until = 0.0
+        self.latency = None       # EWMA of response times
+        self.baseline = None      # lowest EWMA seen: what "healthy" looks like
+        self.last_decrease = 0.0
+        self.slow_start = True    # grow exponentially until the first decrease
+        self.error_rate = 0.0     # EWMA of 5xx/connection errors over recent responses
+
+
+class AdaptiveRateController:
+    """Per-host AIMD control of request rate and concurrency, shared by every fetcher.
+
+    Like TCP, a host starts in slow start: every success adds one
+    request/second and one concurrency slot, doubling both about once per
+    window, until the first decrease. After that each success adds about
+    ADDITIVE_RPS requests/second per second of traffic and one concurrency
+    slot per window of successes. A 429, response times rising above
+    LATENCY_FACTOR times the healthy baseline, or 502/503/504 and connection
+    errors above ERROR_THRESHOLD of recent responses halve both, at most
+    once per cooldown. A Retry-After header also pauses the host until it
+    expires.
+
+    `rps=0` disables rate limiting; concurrency is still adapted.
+    """
+
+    ADDITIVE_RPS = 1.0
+    DECREASE = 0.5
+    LATENCY_FACTOR = 2.0
+    LATENCY_FLOOR = 0.05      # don't react to jitter on responses faster than this
+    LATENCY_ALPHA = 0.2
+    ERROR_ALPHA = 0.02        # about the last 50 responses
+    ERROR_THRESHOLD = 0.1     # sporadic 5xx are retried, not treated as overload
+    DEFAULT_PENALTY = 2.0     # seconds the host is paused after a 429 without Retry-After
+    POLL_SECONDS = 0.01
+
+    def __init__(self, rps, max_concurrency, min_rps=0.5, max_rps=None, start_concurrency=4,
+                 metrics=None):
+        self.rate_limited = bool(rps and rps > 0)
+        self.start_rps = rps if self.rate_limited else 0.0
+        self.min_rps = min(min_rps, self.start_rps) if self.rate_limited else 0.0
+        self.max_rps = max_rps or self.start_rps * 4
+        self.max_concurrency = max(1, max_concurrency)
+        self.start_concurrency = max(1, min(start_concurrency, self.max_concurrency))
+        self.metrics = metrics
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def _host(self, url):
+        host = urlsplit(url).netloc
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = _HostState(self.start_rps, self.start_concurrency)
+        return state
+
+    def _try_reserve(self, url):
+        """Takes a concurrency slot and books a rate slot. Returns seconds to wait, or None if no slot is free."""
+        with self.lock:
+            state = self._host(url)
+            now = time.monotonic()
+            if state.in_flight >= int(state.concurrency) or now < state.blocked_until:
+                return None
+            state.in_flight += 1
+            if not self.rate_limited:
+                return 0.0
+            slot = max(now, state.next_slot)
+            state.next_slot = slot + 1.0 / state.rps
+            return slot - now
+
+    def _unreserve(self, url):
+        """Gives back the concurrency slot of a request that was never sent."""
+        with self.lock:
+            self._host(url).in_flight -= 1
+
+    async def acquire(self, url):
+        """Waits (asyncio) for a concurrency slot and request budget on the host of `url`."""
+        while True:
+            delay = self._try_reserve(url)
+            if delay is not None:
+                break
+            await asyncio.sleep(self.POLL_SECONDS)
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # The slot is already taken: a fetcher cancelled while pacing must not leak it
+                self._unreserve(url)
+                raise
+
+    def acquire_blocking(self, url):
+        """Blocking variant of acquire() for thread pools."""
+        while True:
+            delay = self._try_reserve(url)
+            if delay is not None:
+                break
+            time.sleep(self.POLL_SECONDS)
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, url, status, elapsed, retry_after=None):
+        """Frees the slot taken by acquire() and adapts to the outcome.
+
+        `status` is the HTTP status, or None for a connection error/timeout.
+        """
+        with self.lock:
+            state = self._host(url)
+            state.in_flight -= 1
+            now = time.monotonic()
+
+            throttled = status is None or status in THROTTLE_STATUSES
+            error = throttled and status != 429
+            state.error_rate += self.ERROR_ALPHA * ((1.0 if error else 0.0) - state.error_rate)
+            if throttled:
+                pause = retry_after if retry_after is not None else (
+                    self.DEFAULT_PENALTY if status == 429 else 0.0)
+                if pause:
+                    state.blocked_until = max(state.blocked_until, now + pause)
+                if status == 429 or state.error_rate > self.ERROR_THRESHOLD:
+                    self._decrease(state, now, "error" if status is None else str(status))
+                return
+            if status >= 500:
+                return  # a server bug, not a sign of load
+
+            state.latency = elapsed if state.latency is None else \
+                (1 - self.LATENCY_ALPHA) * state.latency + self.LATENCY_ALPHA * elapsed
+            if state.baseline is None or state.latency < state.baseline:
+                state.baseline = state.latency
+            if state.latency > self.LATENCY_FLOOR and \
+                    state.latency > self.LATENCY_FACTOR * state.baseline:
+                self._decrease(state, now, "latency")
+                return
+
+            # Additive increase (exponential during slow start)
+            if self.rate_limited:
+                step = 1.0 if state.slow_start else self.ADDITIVE_RPS / state.rps
+                state.rps = min(self.max_rps, state.rps + step)
+            step = 1.0 if state.slow_start else 1.0 / state.concurrency
+            state.concurrency = min(self.max_concurrency, state.concurrency + step)
+
+    def _decrease(self, state, now, reason):
+        # One cut per cooldown: a burst of errors from one overload counts once
+        cooldown = max(state.latency or 0.0, 1.0)
+        if now - state.last_decrease < cooldown:
+            return
+        state.last_decrease = now
+        state.slow_start = False
+        if self.rate_limited:
+            state.rps = max(self.min_rps, state.rps * self.DECREASE)
+        state.concurrency = max(1.0, state.concurrency * self.DECREASE)
+        if state.baseline is not None:
+            state.baseline *= 1.1  # let the baseline recover if it was measured on an idle site
+        if self.metrics:
+            self.metrics.inc("throttle_events_total", reason=reason)
+
+    def snapshot(self):
+        """Current rate and concurrency per host."""
+        with self.lock:
+            return {host: {"rps": round(state.rps, 2), "concurrency": int(state.concurrency),
+                           "latency": state.latency}
+                    for host, state in self.hosts.items()}
+
+    def record_metrics(self):
+        """Stores the final per-host rate and concurrency as gauges."""
+        if not self.metrics:
+            return
+        for host, state in self.snapshot().items():
+            self.metrics.set("controller_rps", state["rps"], host=host)
+            self.metrics.set("controller_concurrency", state["concurrency"], host=host)
@@ -0,0 +1,206 @@
+"""Offline trigram index over the catalog's title, author and category.
+
+Text is lowercased and accent-folded ("Cortázar" -> "cortazar", "niño" ->
+"nino") and split into words padded like pg_trgm ("  word "), so partial
+words, missing accents and small typos still match. The index is one
+little-endian file meant to be memory-mapped:
+
+    header    MAGIC, then uint64 docs, trigrams, postings, id bytes
+    keys      uint64[trigrams]      sorted trigrams, 3 x 21-bit code points
+    offsets   uint32[trigrams + 1]  slice of the postings of each trigram
+    docs      uint32[postings]      document numbers, ascending per trigram
+    id_offs   uint32[docs + 1]      slice of each book id in `ids`
+    lengths   uint16[docs]          distinct trigrams per document
+    fields    uint8[postings]       bit mask of the fields holding the trigram
+    ids       bytes                 UTF-8 book ids
+
+Queries look up their few trigrams with a binary search, so the cost
+depends on how common those trigrams are, not on the size of the catalog.
+
+    python search_index.py build                   # newest finished snapshot(s)
+    python search_index.py build <snapshot> ...
+    python search_index.py query "cortazar rayuela"
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+import unicodedata
+from array import array
+import numpy as np
+from snapshots import iter_merged, list_snapshots, read_manifest, resolve_snapshot
+
+SEARCH_INDEX = os.getenv('SCRAPER_SEARCH_INDEX', os.path.join(os.path.dirname(__file__), "search_index.bin"))
+MAGIC = b"BMTRGM01"
+HEADER = struct.Struct("<8s4Q")
+
+FIELDS = ('title', 'author', 'category')
+FIELD_WEIGHTS = np.array([0, 3, 2, 5, 1, 4, 3, 6], dtype=np.float32)  # by mask: title 3, author 2, category 1
+MIN_SHARE = 0.5      # share of the query's trigrams a result must contain
+
+
+def fold(text):
+    """Lowercase, accent-free text with anything but letters and digits turned into spaces."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(' ' if not ch.isalnum() else ch for ch in text if not unicodedata.combining(ch))
+
+
+def trigrams(text):
+    """Set of trigram keys of `text`, each word padded with two leading and one trailing space."""
+    keys = set()
+    for word in fold(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            keys.add((ord(padded[i]) << 42) | (ord(padded[i + 1]) << 21) | ord(padded[i + 2]))
+    return keys
+
+
+def _books(paths):
+    """id -> (title, author, category) over the snapshots, later ones winning."""
+    books = {}
+    for path in paths:
+        for book in iter_merged(path):
+            books[book['id']] = tuple(book.get(field) or '' for field in FIELDS)
+    return books
+
+
+def build_index(paths, output=SEARCH_INDEX):
+    """Indexes the books of the snapshots in `paths` into `output`. Returns the document count."""
+    keys, docs, masks = array('Q'), array('I'), array('B')
+    ids = bytearray()
+    id_offsets = array('I', [0])
+    lengths = array('H')
+
+    for doc, (book_id, values) in enumerate(_books(paths).items()):
+        doc_masks = {}
+        for bit, value in enumerate(values):
+            for key in trigrams(value):
+                doc_masks[key] = doc_masks.get(key, 0) | (1 << bit)
+        keys.extend(doc_masks.keys())
+        masks.extend(doc_masks.values())
+        docs.extend([doc] * len(doc_masks))
+        lengths.append(min(len(doc_masks), 0xFFFF))
+        ids += book_id.encode('utf-8')
+        id_offsets.append(len(ids))
+
+    keys = np.frombuffer(keys, dtype=np.uint64)
+    docs = np.frombuffer(docs, dtype=np.uint32)
+    masks = np.frombuffer(masks, dtype=np.uint8)
+    order = np.lexsort((docs, keys))
+    keys, docs, masks = keys[order], docs[order], masks[order]
+    unique, starts = np.unique(keys, return_index=True)
+    offsets = np.append(starts, len(keys)).astype(np.uint32)
+
+    tmp = f"{output}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(lengths), len(unique), len(docs), len(ids)))
+        for part in (unique, offsets, docs, np.frombuffer(id_offsets, dtype=np.uint32),
+                     np.frombuffer(lengths, dtype=np.uint16), masks):
+            f.write(part.tobytes())
+        f.write(ids)
+    os.replace(tmp, output)
+    return len(lengths)
+
+
+class SearchIndex:
+    """Read-only view of an index file; the arrays are slices of one memory map."""
+
+    def __init__(self, path=SEARCH_INDEX):
+        self.path = path
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, n_docs, n_keys, n_postings, n_ids = HEADER.unpack(raw[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a search index")
+        pos = HEADER.size
+
+        def take(dtype, count):
+            nonlocal pos
+            part = raw[pos:pos + count * np.dtype(dtype).itemsize].view(dtype)
+            pos += part.nbytes
+            return part
+
+        # Widest arrays first so every one of them stays naturally aligned
+        self.keys = take(np.uint64, n_keys)
+        self.offsets = take(np.uint32, n_keys + 1)
+        self.docs = take(np.uint32, n_postings)
+        self.id_offsets = take(np.uint32, n_docs + 1)
+        self.lengths = take(np.uint16, n_docs)
+        self.fields = take(np.uint8, n_postings)
+        self.ids = take(np.uint8, n_ids)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def book_id(self, doc):
+        return self.ids[self.id_offsets[doc]:self.id_offsets[doc + 1]].tobytes().decode('utf-8')
+
+    def search(self, query, limit=20, min_share=MIN_SHARE):
+        """Ranked [(book id, score)] for `query`, best first.
+
+        A book scores the field weights of every query trigram it holds,
+        scaled by the share of the query it covers and slightly penalised
+        for long texts; books holding less than `min_share` of the query's
+        trigrams are left out.
+        """
+        wanted = np.array(sorted(trigrams(query)), dtype=np.uint64)
+        if not len(wanted) or not len(self.keys):
+            return []
+        pos = np.minimum(np.searchsorted(self.keys, wanted), len(self.keys) - 1)
+        pos = pos[self.keys[pos] == wanted]
+        if not len(pos):
+            return []
+        docs = np.concatenate([self.docs[self.offsets[p]:self.offsets[p + 1]] for p in pos])
+        weights = np.concatenate([FIELD_WEIGHTS[self.fields[self.offsets[p]:self.offsets[p + 1]]] for p in pos])
+
+        order = np.argsort(docs, kind='stable')
+        docs, weights = docs[order], weights[order]
+        unique, starts, hits = np.unique(docs, return_index=True, return_counts=True)
+        share = hits / len(wanted)
+        keep = share >= min_share
+        unique, share = unique[keep], share[keep]
+        scores = np.add.reduceat(weights, starts)[keep] * share / np.log2(2 + self.lengths[unique])
+        best = np.argsort(-scores, kind='stable')[:limit]
+        return [(self.book_id(int(unique[i])), round(float(scores[i]), 4)) for i in best]
+
+
+def latest_snapshots():
+    """Newest finished snapshot of each kind of run (one per shard when sharded)."""
+    newest = {}
+    for path in list_snapshots():
+        if read_manifest(path):
+            newest[os.path.basename(path)[15:]] = path  # suffix after the timestamp, as in snapshot_diff
+    return sorted(newest.values())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline trigram search index for the catalog")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build the index from catalog snapshots")
+    build.add_argument('snapshots', nargs='*', help="Snapshot names or directories (default: newest finished)")
+    build.add_argument('--output', default=SEARCH_INDEX, help="Index file")
+    query = sub.add_parser("query", help="Ranked book ids for a search")
+    query.add_argument('text')
+    query.add_argument('--index', default=SEARCH_INDEX, help="Index file")
+    query.add_argument('--limit', type=int, default=20)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "build":
+        paths = [resolve_snapshot(name) for name in args.snapshots] if args.snapshots else latest_snapshots()
+        if not paths or None in paths:
+            print("❌ No finished snapshot to index.")
+            sys.exit(1)
+        started = time.time()
+        count = build_index(paths, args.output)
+        print(f"🔎 Indexed {count} books from {len(paths)} snapshot(s) into {args.output} "
+              f"({os.path.getsize(args.output) / 1e6:.1f} MB, {time.time() - started:.1f}s)")
+    else:
+        index = SearchIndex(args.index)
+        started = time.perf_counter()
+        results = index.search(args.text, args.limit)
+        for book_id, score in results:
+            print(f"{score:8.3f}  {book_id}")
+        print(f"⏱️ {len(results)} results in {1000 * (time.perf_counter() - started):.1f} ms")
@@ -0,0 +1,308 @@
+"""Deterministic sharding of the detail scrape, plus a small coordinator.
+
+Every shard runs `bibliometro_details.py --shard-index I --shard-count N` on
+the same URL list and keeps only the URLs that hash to it, with its own
+state file, progress file and metrics (the main state file only gets the
+shard's confirmed sitemap lastmods, in one transaction at the end of the
+shard). The coordinator reads the progress files, reports stragglers and
+merges the results:
+
+    python shards.py launch --count 4 -- --full     # run 4 local shards, then merge
+    python shards.py status                         # progress and stragglers
+    python shards.py merge                          # totals + books split across shards
+
+Shards on other machines only need SCRAPER_SHARD_DIR pointing at a shared
+directory for the coordinator to see them.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+from metrics import Metrics
+from worker_state import STATE_FILE, merge_records
+
+SHARD_DIR = os.getenv('SCRAPER_SHARD_DIR', os.path.join(os.path.dirname(__file__), "shards"))
+PROGRESS_INTERVAL = 5.0   # seconds between progress file writes
+STALE_SECONDS = 120       # a running shard that has not written progress for this long is stalled
+STRAGGLER_FACTOR = 1.5    # projected duration above this times the median is a straggler
+POLL_SECONDS = 10
+
+# WordPress gives duplicate titles slugs like "el-principito-2"
+SLUG_SUFFIX_RE = re.compile(r'-\d+$')
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping & Veach): growing from N to N+1 buckets moves only 1/(N+1) of the keys."""
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_key(url):
+    """Part of the URL that decides its shard: the slug without its duplicate suffix.
+
+    The host is ignored, so the simulator shards like the real site, and
+    pages of the same title ("libro", "libro-2") land on the same shard,
+    where their records can be merged.
+    """
+    slug = urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]
+    return SLUG_SUFFIX_RE.sub('', slug)
+
+
+def shard_of(url, count):
+    """Shard (0..count-1) owning `url`. Stable across runs and as the catalog grows."""
+    digest = hashlib.blake2b(shard_key(url).encode('utf-8'), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, 'big'), count)
+
+
+def select_shard(urls, index, count):
+    return [url for url in urls if shard_of(url, count) == index]
+
+
+def shard_name(index, count):
+    return f"shard-{index}-of-{count}"
+
+
+def state_path(index, count):
+    """Per-shard SQLite state, so several shards can share a directory."""
+    base, ext = os.path.splitext(STATE_FILE)
+    return f"{base}.{shard_name(index, count)}{ext}"
+
+
+class ShardProgress:
+    """Progress file of one shard (<SHARD_DIR>/shard-I-of-N.json), rewritten atomically."""
+
+    def __init__(self, index, count, total, directory=SHARD_DIR):
+        self.path = os.path.join(directory, f"{shard_name(index, count)}.json")
+        self.last_write = 0.0
+        self.data = {
+            "shard": index,
+            "count": count,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "status": "running",
+            "total": total,
+            "done": 0,
+            "started_at": time.time(),
+            "updated_at": time.time(),
+        }
+        os.makedirs(directory, exist_ok=True)
+        self._write()
+
+    def advance(self, n=1):
+        self.data["done"] += n
+        if time.monotonic() - self.last_write >= PROGRESS_INTERVAL:
+            self._write()
+
+    def finish(self, result):
+        self.data.update(status="finished", finished_at=time.time(), result=result)
+        self._write()
+
+    def fail(self, error):
+        self.data.update(status="failed", finished_at=time.time(), error=str(error))
+        self._write()
+
+    def _write(self):
+        self.last_write = time.monotonic()
+        self.data["updated_at"] = time.time()
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+# --- Coordinator ------------------------------------------------------------
+
+def read_progress(count=None, directory=SHARD_DIR):
+    """Progress files by shard index, for the newest shard count seen (or `count`)."""
+    shards = {}
+    for path in glob.glob(os.path.join(directory, "shard-*-of-*.json")):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced right now
+        shards.setdefault(data["count"], {})[data["shard"]] = data
+    if not shards:
+        return None, {}
+    if count is None:
+        count = max(shards, key=lambda n: max(s["updated_at"] for s in shards[n].values()))
+    return count, shards.get(count, {})
+
+
+def _projected_seconds(shard, now):
+    """Total run time of a shard: actual if finished, extrapolated from its rate otherwise."""
+    elapsed = shard.get("finished_at", now) - shard["started_at"]
+    if shard["status"] != "running":
+        return elapsed
+    if not shard["done"]:
+        return None
+    return elapsed * shard["total"] / shard["done"]
+
+
+def find_stragglers(count, shards, now=None):
+    """Returns [(index, reason)] for missing, failed, stalled and slow shards."""
+    now = now or time.time()
+    stragglers = [(i, "missing") for i in range(count) if i not in shards]
+    projected = {i: _projected_seconds(s, now) for i, s in shards.items()}
+    known = [seconds for seconds in projected.values() if seconds is not None]
+    median = statistics.median(known) if known else None
+    for i, shard in sorted(shards.items()):
+        if shard["status"] == "failed":
+            stragglers.append((i, f"failed: {shard.get('error')}"))
+        elif shard["status"] == "running" and now - shard["updated_at"] > STALE_SECONDS:
+            stragglers.append((i, f"stalled {now - shard['updated_at']:.0f}s ago on {shard['host']}"))
+        elif shard["status"] == "running" and median and projected[i] is not None \
+                and projected[i] > STRAGGLER_FACTOR * median:
+            stragglers.append((i, f"slow: projected {projected[i]:.0f}s vs median {median:.0f}s"))
+    return stragglers
+
+
+def print_status(count, shards):
+    now = time.time()
+    print(f"🧩 {len(shards)}/{count} shards reporting:")
+    for i, shard in sorted(shards.items()):
+        pct = 100 * shard["done"] / shard["total"] if shard["total"] else 100.0
+        print(f"   [{i}] {shard['status']:<8} {shard['done']:>7}/{shard['total']:<7} ({pct:5.1f}%) "
+              f"{now - shard['started_at']:>7.0f}s  {shard['host']}")
+    stragglers = find_stragglers(count, shards, now)
+    for i, reason in stragglers:
+        print(f"   🐢 shard {i}: {reason}")
+    return stragglers
+
+
+def split_books(paths):
+    """Merged records of the book ids whose URLs ended up on more than one shard.
+
+    Each shard only merges the sources it scraped itself, so these ids were
+    uploaded with partial stock; their merge over all shards is returned.
+    """
+    sources = {}
+    owners = {}
+    for path in paths:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            for book_id, record in conn.execute("SELECT id, record FROM book_sources"):
+                sources.setdefault(book_id, []).append(json.loads(record))
+                owners.setdefault(book_id, set()).add(path)
+        except sqlite3.OperationalError:
+            pass  # shard never got far enough to create the table
+        finally:
+            conn.close()
+    return [merge_records(sources[book_id]) for book_id, paths in owners.items() if len(paths) > 1]
+
+
+def merge(count, shards, upload=True):
+    """Sums the shards' results, writes the `details-shards` metrics and re-uploads split books."""
+    metrics = Metrics("details-shards")
+    totals = {}
+    journal = {}
+    for i, shard in sorted(shards.items()):
+        metrics.set("shard_urls", shard["total"], shard=i)
+        metrics.set("shard_done_urls", shard["done"], shard=i)
+        metrics.set("shard_seconds", round(shard.get("finished_at", time.time()) - shard["started_at"], 3), shard=i)
+        result = shard.get("result") or {}
+        for name, value in result.get("savings", {}).items():
+            totals[name] = totals.get(name, 0) + value
+        for name, value in result.get("journal", {}).items():
+            journal[name] = journal.get(name, 0) + value
+    for name, value in journal.items():
+        metrics.set("journal_urls", value, status=name)
+
+    stragglers = find_stragglers(count, shards)
+    for i, reason in stragglers:
+        print(f"   🐢 shard {i}: {reason}")
+    metrics.set("shards", count)
+    metrics.set("shard_stragglers", len(stragglers))
+
+    paths = [path for path in (state_path(i, count) for i in range(count)) if os.path.exists(path)]
+    split = split_books(paths) if paths else []
+    metrics.set("split_books", len(split))
+    if split and upload:
+        # Imported here so `status` works without the worker's configuration
+        from bibliometro_details import API_URL, API_SECRET
+        from uploader import BatchUploader
+        uploader = BatchUploader(API_URL, API_SECRET, metrics=metrics)
+        for book in split:
+            uploader.submit(book)
+        uploader.close()
+
+    metrics.write()
+    print(f"🧮 Merged {len(shards)}/{count} shards: {sum(s['total'] for s in shards.values())} URLs, "
+          + ", ".join(f"{value} {name}" for name, value in sorted(journal.items())))
+    if totals:
+        print(f"   {totals.get('not_modified', 0)} not modified, {totals.get('unchanged', 0)} unchanged.")
+    if paths:
+        print(f"📚 {len(split)} books had URLs on several shards"
+              + (" and were re-uploaded merged." if split and upload else "."))
+    elif count:
+        print("   ↪ No shard state files here; books split across shards were not checked.")
+    return stragglers
+
+
+def launch(count, worker_args):
+    """Runs `count` local shards as subprocesses, reports progress until they exit, then merges."""
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bibliometro_details.py")
+    procs = {}
+    for i in range(count):
+        log = open(os.path.join(SHARD_DIR, f"{shard_name(i, count)}.log"), 'w', encoding='utf-8')
+        procs[i] = subprocess.Popen(
+            [sys.executable, script, '--shard-index', str(i), '--shard-count', str(count), *worker_args],
+            stdout=log, stderr=subprocess.STDOUT
+        )
+        log.close()
+    print(f"🚀 Launched {count} shards (logs in {SHARD_DIR}).")
+    while any(proc.poll() is None for proc in procs.values()):
+        time.sleep(POLL_SECONDS)
+        print_status(count, read_progress(count)[1])
+    for i, proc in procs.items():
+        if proc.returncode:
+            print(f"❌ Shard {i} exited with code {proc.returncode}")
+    return merge(count, read_progress(count)[1])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Coordinator for sharded detail scraping")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('launch', help="Run N local shards, then merge their results")
+    run.add_argument('--count', type=int, required=True, help="Number of shards")
+    run.add_argument('worker_args', nargs=argparse.REMAINDER,
+                     help="Arguments passed to every bibliometro_details.py (after --)")
+    for name, help_text in (('status', "Show shard progress and stragglers"),
+                            ('merge', "Merge finished shards and re-upload books split across shards")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument('--count', type=int, default=None,
+                         help="Shard count of the run (default: most recent)")
+    sub.choices['merge'].add_argument('--no-upload', action='store_true',
+                                      help="Only report books split across shards")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'launch':
+        worker_args = args.worker_args[1:] if args.worker_args[:1] == ['--'] else args.worker_args
+        stragglers = launch(args.count, worker_args)
+    else:
+        count, shards = read_progress(args.count)
+        if not count:
+            print(f"❌ No shard progress files in {SHARD_DIR}")
+            sys.exit(1)
+        if args.command == 'status':
+            stragglers = print_status(count, shards)
+        else:
+            stragglers = merge(count, shards, upload=not args.no_upload)
+    sys.exit(1 if stragglers else 0)
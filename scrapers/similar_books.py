@@ -0,0 +1,253 @@
+"""Precomputed "more like this" table from TF-IDF vectors of the catalog.
+
+Every book becomes a sparse TF-IDF vector over the accent-folded words of
+its title (counted twice), description and category, plus one token for
+the author, so books by the same author stay close. Rows are L2-normalised,
+which makes cosine similarity a plain dot product. The top-k neighbours of
+every book come from blocked sparse products: for a block of books, each
+term's posting list (the CSC form of the matrix) is expanded and
+accumulated into a dense block x catalog score buffer with np.bincount.
+Terms found in too many books (MAX_DF) are dropped. They carry little weight
+and dominate the cost.
+
+The table is one little-endian file, memory-mappable like the search index:
+
+    header      MAGIC, then uint64 docs, k, id bytes
+    neighbours  uint32[docs * k]    document numbers, best first (NO_NEIGHBOUR pads)
+    id_offs     uint32[docs + 1]    slice of each book id in `ids`
+    scores      float16[docs * k]   cosine similarity
+    ids         bytes               UTF-8 book ids
+
+    python similar_books.py build                # newest finished snapshot(s)
+    python similar_books.py query <book id>
+    python similar_books.py export similar.ndjson
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+import numpy as np
+from search_index import fold, latest_snapshots
+from snapshots import iter_merged, resolve_snapshot
+
+SIMILAR_TABLE = os.getenv('SCRAPER_SIMILAR_TABLE', os.path.join(os.path.dirname(__file__), "similar_books.bin"))
+MAGIC = b"BMSIMK01"
+HEADER = struct.Struct("<8s3Q")
+NO_NEIGHBOUR = 0xFFFFFFFF
+
+TOP_K = 10
+MIN_DF = 2            # a term in a single book says nothing about similarity
+MAX_DF = 0.05         # share of the catalog above which a term is ignored
+BLOCK_CELLS = 8_000_000   # block rows x catalog size of the dense score buffer (64 MB)
+
+STOPWORDS = frozenset("""
+    a al algo ante con como cual cuando de del desde donde el ella ellas ellos en entre era es esa ese
+    eso esta este esto fue ha han hasta la las le les lo los mas mi muy no nos o para pero por que se
+    ser si sin sobre su sus tambien te tiene un una uno unos y ya yo the of and
+""".split())
+
+
+def tokens(book):
+    """Terms of a book: words of title (twice), description and category, plus one author term."""
+    words = []
+    for field, repeat in (('title', 2), ('description', 1), ('category', 1)):
+        text = book.get(field)
+        if text:
+            words += [word for word in fold(text).split()
+                      if len(word) > 2 and word not in STOPWORDS and not word.isdigit()] * repeat
+    author = ' '.join(fold(book.get('author') or '').split())
+    if author:
+        words.append(f"author:{author}")
+    return words
+
+
+def tfidf_matrix(docs):
+    """CSR (indptr, indices, data) of L2-normalised TF-IDF rows for lists of terms.
+
+    tf is sublinear (1 + log count), idf is log(N / df); terms outside
+    [MIN_DF, MAX_DF * N] are left out of the vocabulary.
+    """
+    vocabulary = {}
+    rows, cols = array('I'), array('I')
+    for row, terms in enumerate(docs):
+        for term in terms:
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+    n = len(docs)
+    rows = np.frombuffer(rows, dtype=np.uint32).astype(np.int64)
+    cols = np.frombuffer(cols, dtype=np.uint32).astype(np.int64)
+
+    # Term counts per (row, col) pair
+    pairs, counts = np.unique(rows * max(len(vocabulary), 1) + cols, return_counts=True)
+    rows, cols = pairs // max(len(vocabulary), 1), pairs % max(len(vocabulary), 1)
+    df = np.bincount(cols, minlength=len(vocabulary))
+    keep = (df[cols] >= MIN_DF) & (df[cols] <= max(MIN_DF, MAX_DF * n))
+    rows, cols, counts = rows[keep], cols[keep], counts[keep]
+    idf = np.log(n / np.maximum(df, 1))
+    data = ((1 + np.log(counts)) * idf[cols]).astype(np.float32)
+
+    norms = np.sqrt(np.bincount(rows, weights=data.astype(np.float64) ** 2, minlength=n))
+    data /= np.maximum(norms[rows], 1e-12).astype(np.float32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols.astype(np.uint32), data, len(vocabulary)
+
+
+def _transpose(indptr, indices, data, columns):
+    """CSR -> CSC: the posting list (rows, weights) of every term."""
+    order = np.argsort(indices, kind='stable')
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.uint32), np.diff(indptr))
+    col_ptr = np.zeros(columns + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=columns), out=col_ptr[1:])
+    return col_ptr, rows[order], data[order]
+
+
+def top_neighbours(indptr, indices, data, columns, k=TOP_K):
+    """(neighbours uint32[n, k], scores float32[n, k]) by cosine similarity, best first."""
+    n = len(indptr) - 1
+    col_ptr, col_rows, col_data = _transpose(indptr, indices, data, columns)
+    neighbours = np.full((n, k), NO_NEIGHBOUR, dtype=np.uint32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    block = max(1, BLOCK_CELLS // max(n, 1))
+    k_eff = min(k, n - 1)
+
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        lo, hi = indptr[start], indptr[stop]
+        terms = indices[lo:hi]
+        local = np.repeat(np.arange(stop - start), np.diff(indptr[start:stop + 1]))
+        # Expand each (book, term) entry into the term's whole posting list
+        lengths = col_ptr[terms + 1] - col_ptr[terms]
+        total = int(lengths.sum())
+        if not total or k_eff < 1:
+            continue
+        firsts = np.repeat(col_ptr[terms] - np.cumsum(lengths) + lengths, lengths)
+        postings = firsts + np.arange(total)
+        keys = np.repeat(local, lengths) * n + col_rows[postings]
+        values = np.repeat(data[lo:hi], lengths) * col_data[postings]
+        block_scores = np.bincount(keys, weights=values, minlength=(stop - start) * n)
+        block_scores = block_scores.reshape(stop - start, n)
+        block_scores[np.arange(stop - start), np.arange(start, stop)] = 0  # not its own neighbour
+
+        best = np.argpartition(-block_scores, k_eff - 1, axis=1)[:, :k_eff]
+        best_scores = np.take_along_axis(block_scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        found = best_scores > 0
+        neighbours[start:stop, :k_eff] = np.where(found, best, NO_NEIGHBOUR)
+        scores[start:stop, :k_eff] = np.where(found, best_scores, 0)
+    return neighbours, scores
+
+
+def build_table(paths, output=SIMILAR_TABLE, k=TOP_K):
+    """Computes the neighbour table of the books in the snapshots `paths`. Returns the book count."""
+    books = {}
+    for path in paths:
+        for book in iter_merged(path):
+            books[book['id']] = tokens(book)  # later snapshots win
+    ids = list(books)
+    indptr, indices, data, columns = tfidf_matrix(list(books.values()))
+    del books
+    neighbours, scores = top_neighbours(indptr, indices, data, columns, k)
+
+    blob = bytearray()
+    id_offsets = array('I', [0])
+    for book_id in ids:
+        blob += book_id.encode('utf-8')
+        id_offsets.append(len(blob))
+    tmp = f"{output}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(ids), k, len(blob)))
+        f.write(neighbours.tobytes())
+        f.write(np.frombuffer(id_offsets, dtype=np.uint32).tobytes())
+        f.write(scores.astype(np.float16).tobytes())
+        f.write(blob)
+    os.replace(tmp, output)
+    return len(ids)
+
+
+class SimilarBooks:
+    """Read-only, memory-mapped view of a neighbour table."""
+
+    def __init__(self, path=SIMILAR_TABLE):
+        raw = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, n_docs, self.k, n_ids = HEADER.unpack(raw[:HEADER.size].tobytes())
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a similar-books table")
+        pos = HEADER.size
+        parts = []
+        for dtype, count in ((np.uint32, n_docs * self.k), (np.uint32, n_docs + 1),
+                             (np.float16, n_docs * self.k), (np.uint8, n_ids)):
+            parts.append(raw[pos:pos + count * np.dtype(dtype).itemsize].view(dtype))
+            pos += parts[-1].nbytes
+        neighbours, self.id_offsets, scores, self.ids = parts
+        self.neighbours = neighbours.reshape(n_docs, self.k)
+        self.scores = scores.reshape(n_docs, self.k)
+        self._docs = None
+
+    def __len__(self):
+        return len(self.neighbours)
+
+    def book_id(self, doc):
+        return self.ids[self.id_offsets[doc]:self.id_offsets[doc + 1]].tobytes().decode('utf-8')
+
+    def doc(self, book_id):
+        if self._docs is None:  # built on first lookup by id
+            self._docs = {self.book_id(doc): doc for doc in range(len(self))}
+        return self._docs.get(book_id)
+
+    def similar(self, book_id, limit=None):
+        """[(book id, score)] of the books most similar to `book_id`, best first."""
+        doc = self.doc(book_id)
+        if doc is None:
+            return []
+        return [(self.book_id(int(other)), round(float(score), 4))
+                for other, score in zip(self.neighbours[doc][:limit], self.scores[doc][:limit])
+                if other != NO_NEIGHBOUR]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Precomputed similar-books table (TF-IDF, top-k)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build the table from catalog snapshots")
+    build.add_argument('snapshots', nargs='*', help="Snapshot names or directories (default: newest finished)")
+    build.add_argument('--output', default=SIMILAR_TABLE, help="Table file")
+    build.add_argument('--k', type=int, default=TOP_K, help="Neighbours kept per book")
+    query = sub.add_parser("query", help="Similar books of one book id")
+    query.add_argument('book_id')
+    query.add_argument('--table', default=SIMILAR_TABLE, help="Table file")
+    export = sub.add_parser("export", help="Write the table as NDJSON ({id, similar: [[id, score], ...]})")
+    export.add_argument('output')
+    export.add_argument('--table', default=SIMILAR_TABLE, help="Table file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "build":
+        paths = [resolve_snapshot(name) for name in args.snapshots] if args.snapshots else latest_snapshots()
+        if not paths or None in paths:
+            print("❌ No finished snapshot to read.")
+            sys.exit(1)
+        started = time.time()
+        count = build_table(paths, args.output, args.k)
+        print(f"🧭 {args.k} neighbours for {count} books in {args.output} "
+              f"({os.path.getsize(args.output) / 1e6:.1f} MB, {time.time() - started:.1f}s)")
+    elif args.command == "query":
+        table = SimilarBooks(args.table)
+        results = table.similar(args.book_id)
+        if not results:
+            print(f"❌ No neighbours for {args.book_id}")
+        for book_id, score in results:
+            print(f"{score:6.3f}  {book_id}")
+    else:
+        table = SimilarBooks(args.table)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for doc in range(len(table)):
+                book_id = table.book_id(doc)
+                f.write(json.dumps({"id": book_id, "similar": table.similar(book_id)}, ensure_ascii=False) + "\n")
+        print(f"📝 {len(table)} rows written to {args.output}")
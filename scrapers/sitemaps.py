@@ -0,0 +1,143 @@
+import logging
+import time
+import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from rate_limit import parse_retry_after
+
+logger = logging.getLogger()
+
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 64 * 1024
+
+
+def _local(tag):
+    """Strips the XML namespace: '{http://...}loc' -> 'loc'."""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _iter_body(response, metrics=None):
+    """Yields the response body in chunks, transparently un-gzipping .xml.gz files."""
+    inflater = None
+    first = True
+    # iter_content only decodes Content-Encoding: a .xml.gz served as a plain file is
+    # still gzip bytes, one sent with Content-Encoding: gzip is already XML. Only the
+    # magic bytes tell them apart, not the URL.
+    for chunk in response.iter_content(CHUNK_SIZE):
+        if metrics:
+            metrics.inc("fetch_bytes_total", len(chunk))
+        if first:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        yield inflater.decompress(chunk) if inflater else chunk
+    if inflater:
+        yield inflater.flush()
+
+
+def parse_sitemap(session, url, timeout=15, metrics=None, controller=None):
+    """Parses one sitemap incrementally while it downloads.
+
+    Yields ('sitemap', loc, lastmod) for child sitemaps of an index and
+    ('url', loc, lastmod) for page entries. Only <loc>/<lastmod> that are
+    direct children of an entry count, so nested extensions such as Yoast's
+    <image:image><image:loc> never replace the page URL. Entries are dropped
+    from the tree as soon as they are read, so memory stays flat regardless
+    of document size.
+
+    With an AdaptiveRateController, the GET waits for the host's budget and
+    its outcome (None for a connection error) is fed back once the sitemap
+    has been read.
+    """
+    if controller:
+        controller.acquire_blocking(url)
+    started = time.perf_counter()
+    status = retry_after = None
+    try:
+        with session.get(url, timeout=timeout, stream=True) as response:
+            status = response.status_code
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if metrics:
+                metrics.inc("responses_total", status=response.status_code)
+            if response.status_code != 200:
+                logger.warning(f"   -> {url} respondió {response.status_code}")
+                return
+
+            parser = ET.XMLPullParser(events=('start', 'end'))
+            root = None
+            depth = 0  # 1 = <urlset>/<sitemapindex>, 2 = <url>/<sitemap>, 3 = their fields
+            loc = lastmod = None
+            for chunk in _iter_body(response, metrics):
+                parser.feed(chunk)
+                for event, elem in parser.read_events():
+                    if event == 'start':
+                        if root is None:
+                            root = elem
+                        depth += 1
+                        continue
+                    tag = _local(elem.tag)
+                    if depth == 3 and tag == 'loc':
+                        loc = (elem.text or '').strip()
+                    elif depth == 3 and tag == 'lastmod':
+                        lastmod = (elem.text or '').strip() or None
+                    elif depth == 2 and tag in ('url', 'sitemap'):
+                        if loc:
+                            yield ('sitemap' if tag == 'sitemap' else 'url'), loc, lastmod
+                        loc = lastmod = None
+                        # Drop the processed entries so the tree never grows
+                        root.clear()
+                    depth -= 1
+            parser.close()
+    finally:
+        if controller:
+            controller.release(url, status, time.perf_counter() - started, retry_after)
+
+
+def ingest_sitemaps(session, roots, on_url, url_filter=None, workers=4, timeout=15, metrics=None,
+                    controller=None):
+    """Walks sitemap indexes recursively, fetching child sitemaps in parallel.
+
+    Every page URL accepted by `url_filter` is streamed to `on_url(url, lastmod)`
+    as soon as it is parsed; nothing is accumulated here. Returns the number of
+    URLs delivered per sitemap. With `metrics`, each sitemap records its
+    download-and-parse time, status and bytes. With `controller` (an
+    AdaptiveRateController), every sitemap GET is paced by it.
+    """
+    seen = set(roots)
+    counts = {}
+
+    def crawl(sitemap_url):
+        children, count = [], 0
+        started = time.perf_counter()
+        try:
+            for kind, loc, lastmod in parse_sitemap(session, sitemap_url, timeout, metrics, controller):
+                if kind == 'sitemap':
+                    children.append(loc)
+                elif url_filter is None or url_filter(loc):
+                    on_url(loc, lastmod)
+                    count += 1
+        except ET.ParseError:
+            logger.warning(f"   -> {sitemap_url} no es un XML válido o legible.")
+        except Exception as e:
+            logger.warning(f"   -> Fallo al leer {sitemap_url}: {e}")
+            if metrics:
+                metrics.inc("responses_total", status="error")
+        if metrics:
+            metrics.observe("fetch_seconds", time.perf_counter() - started, kind="sitemap")
+            metrics.inc("sitemap_urls_total", count)
+        return sitemap_url, count, children
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(crawl, url) for url in roots}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                sitemap_url, count, children = future.result()
+                counts[sitemap_url] = count
+                if count:
+                    logger.info(f"   -> ¡ÉXITO! Extraídas {count} URLs de libros de {sitemap_url}")
+                for child in children:
+                    if child not in seen:
+                        seen.add(child)
+                        pending.add(pool.submit(crawl, child))
+    return counts
@@ -0,0 +1,155 @@
+"""Change events between two catalog snapshots.
+
+Compares the merged per-id records of a snapshot against an older one with
+a hash join on `id` and writes one JSON event per line to
+<current>/changes.ndjson.<codec>:
+
+    {"type": "added", "id": ..., "title": ..., "url": ...}
+    {"type": "removed", "id": ..., "title": ...}
+    {"type": "field_changed", "id": ..., "field": "description", "old": ..., "new": ...}
+    {"type": "stock_changed", "id": ..., "branch": "Baquedano", "old": 0, "new": 2}
+
+Only the older snapshot is indexed (a digest, the stock and the title per
+id); both are streamed, and the old values of changed records are read in
+a second pass, so time and memory stay linear in the number of books.
+
+    python snapshot_diff.py                       # newest snapshot vs the one before it
+    python snapshot_diff.py <current> <previous>
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from snapshots import SNAPSHOT_DIR, LineWriter, iter_merged, iter_ndjson, list_snapshots, read_manifest, resolve_snapshot
+
+EVENT_TYPES = ('added', 'removed', 'field_changed', 'stock_changed')
+
+
+def _stock(book):
+    return {loc['branch']: loc['stock'] for loc in book.get('locations') or []}
+
+
+def _fields(book):
+    return {key: value for key, value in book.items() if key != 'locations'}
+
+
+def record_digest(book):
+    """Digest of everything but the stock, which is compared branch by branch."""
+    raw = json.dumps(_fields(book), sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def index_snapshot(path):
+    """id -> (record digest, stock per branch, title) for every book of a snapshot."""
+    return {book['id']: (record_digest(book), tuple(sorted(_stock(book).items())), book.get('title'))
+            for book in iter_merged(path)}
+
+
+def diff_snapshots(current, previous, output=None, removals=True):
+    """Writes the change events of `current` relative to `previous`. Returns counts per type.
+
+    `removals` should be False when `current` does not hold the whole
+    catalog, where a missing book is not a removed one.
+    """
+    codec = read_manifest(current)["codec"] if read_manifest(current) else "gz"
+    output = output or os.path.join(current, f"changes.ndjson.{codec}")
+    if os.path.exists(output):
+        os.remove(output)
+    events = LineWriter(output, codec)
+    counts = dict.fromkeys(EVENT_TYPES, 0)
+
+    def emit(event):
+        events.write(json.dumps(event, ensure_ascii=False))
+        counts[event["type"]] += 1
+
+    old = index_snapshot(previous)
+    seen = set()
+    # id -> new fields of the changed records, compared with the old ones in a second pass over `previous`
+    pending = {}
+    for book in iter_merged(current):
+        book_id = book['id']
+        seen.add(book_id)
+        entry = old.get(book_id)
+        if entry is None:
+            emit({"type": "added", "id": book_id, "title": book.get('title'), "url": book.get('url')})
+            continue
+        old_digest, old_stock, _ = entry
+        if record_digest(book) != old_digest:
+            pending[book_id] = _fields(book)
+        old_stock = dict(old_stock)
+        new_stock = _stock(book)
+        for branch in sorted(old_stock.keys() | new_stock.keys()):
+            if old_stock.get(branch, 0) != new_stock.get(branch, 0):
+                emit({"type": "stock_changed", "id": book_id, "branch": branch,
+                      "old": old_stock.get(branch, 0), "new": new_stock.get(branch, 0)})
+
+    if removals:
+        for book_id, (_, _, title) in old.items():
+            if book_id not in seen:
+                emit({"type": "removed", "id": book_id, "title": title})
+    del old, seen
+
+    if pending:
+        for book in iter_merged(previous):
+            new = pending.pop(book['id'], None)
+            if new is None:
+                continue
+            old = _fields(book)
+            for field in sorted(old.keys() | new.keys()):
+                if old.get(field) != new.get(field):
+                    emit({"type": "field_changed", "id": book['id'], "field": field,
+                          "old": old.get(field), "new": new.get(field)})
+            if not pending:
+                break
+
+    events.close()
+    return counts
+
+
+def iter_changes(path):
+    """Streams the events of a changes.ndjson file."""
+    return iter_ndjson(path)
+
+
+def _suffix(path):
+    # Run names start with a %Y%m%dT%H%M%S timestamp: "20250101T020000-shard-1-of-4" -> "-shard-1-of-4"
+    return os.path.basename(path)[15:]
+
+
+def previous_snapshot(current, directory=SNAPSHOT_DIR):
+    """Newest finished snapshot older than `current` of the same kind of run (same shard)."""
+    name = os.path.basename(current)
+    candidates = [path for path in list_snapshots(directory)
+                  if os.path.basename(path) < name and read_manifest(path) and _suffix(path) == _suffix(current)]
+    return candidates[-1] if candidates else None
+
+
+def covers_catalog(path):
+    """True if the snapshot holds the whole catalog, so a missing book was removed."""
+    manifest = read_manifest(path) or {}
+    return manifest.get("kind") == "export" or bool(manifest.get("complete"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Change events between two catalog snapshots")
+    parser.add_argument('current', nargs='?', help="Snapshot directory (default: newest finished)")
+    parser.add_argument('previous', nargs='?', help="Older snapshot (default: the one before `current`)")
+    parser.add_argument('--output', help="Events file (default: <current>/changes.ndjson.<codec>)")
+    parser.add_argument('--removals', action='store_true',
+                        help="Report missing books as removed even if `current` is not a complete snapshot")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    finished = [path for path in list_snapshots() if read_manifest(path)]
+    current = resolve_snapshot(args.current) if args.current else (finished[-1] if finished else None)
+    previous = resolve_snapshot(args.previous) if args.previous else (
+        previous_snapshot(current) if current else None)
+    if not current or not previous:
+        print("❌ Need two finished snapshots to compare.")
+        sys.exit(1)
+    counts = diff_snapshots(current, previous, args.output, removals=args.removals or covers_catalog(current))
+    print(f"🔀 {os.path.basename(previous)} -> {os.path.basename(current)}: "
+          + ", ".join(f"{count} {name}" for name, count in counts.items()))
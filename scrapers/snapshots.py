@@ -0,0 +1,403 @@
+"""Compressed, append-only snapshots of the scraped catalog.
+
+Every detail run writes a directory under SCRAPER_SNAPSHOT_DIR:
+
+    <run>/books.ndjson.zst   one book_data per line (.gz when zstandard is not installed)
+    <run>/stock.tsv.zst      locations flattened: id, url, branch, stock
+    <run>/manifest.json      written last: counts, codec, start/end time
+
+The worker writes the records it parsed, then carries over the stored
+record of every other catalog URL, so each snapshot is the whole catalog
+as known after that run ("complete" in the manifest).
+
+Both data files are sequences of independently compressed frames, flushed
+every FLUSH_RECORDS records, so a crashed run still leaves a readable
+prefix and --resume keeps appending to it. The readers stream frame by
+frame and never hold more than one record:
+
+Old snapshots are pruned after every worker run and export: of each kind
+of run (same name suffix, e.g. one shard) the newest KEEP_SNAPSHOTS
+finished ones are always kept, older ones go once they are more than
+MAX_AGE_DAYS old. Unfinished snapshots are never touched.
+
+    python snapshots.py list
+    python snapshots.py export              # full snapshot from the worker state, no network
+    python snapshots.py upload <run>        # re-send a snapshot through the batch API
+    python snapshots.py prune --keep 7 --max-age-days 14
+"""
+import argparse
+import glob
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # gzip fallback
+    zstandard = None
+
+SNAPSHOT_DIR = os.getenv('SCRAPER_SNAPSHOT_DIR', os.path.join(os.path.dirname(__file__), "snapshots"))
+FLUSH_RECORDS = 500
+KEEP_SNAPSHOTS = int(os.getenv('SCRAPER_SNAPSHOT_KEEP', '14'))
+MAX_AGE_DAYS = float(os.getenv('SCRAPER_SNAPSHOT_MAX_AGE_DAYS', '30'))
+STOCK_HEADER = "id\turl\tbranch\tstock"
+# id and url of a book_data line as json.dumps writes it (id first), without parsing the whole record
+RECORD_KEY_RE = re.compile(r'^\{"id": "((?:[^"\\]|\\.)*)".*?, "url": "((?:[^"\\]|\\.)*)"')
+
+
+def _codec():
+    return "zst" if zstandard else "gz"
+
+
+def _compress(data, codec):
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _tsv(value):
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+
+def _untsv(value):
+    return value.replace('\\n', '\n').replace('\\t', '\t').replace('\\\\', '\\')
+
+
+class LineWriter:
+    """Appends text lines to a file as independently compressed frames of FLUSH_RECORDS lines."""
+
+    def __init__(self, path, codec, header=None):
+        self.path = path
+        self.codec = codec
+        self.count = _repair(path, codec)
+        self.file = open(path, 'ab')
+        self.pending = []
+        if header and self.file.tell() == 0:
+            self.file.write(_compress(f"{header}\n".encode('utf-8'), codec))
+        elif header:
+            self.count -= 1
+
+    def write(self, line):
+        self.pending.append(line)
+        if len(self.pending) >= FLUSH_RECORDS:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(_compress(("\n".join(self.pending) + "\n").encode('utf-8'), self.codec))
+            self.count += len(self.pending)
+            self.pending = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class SnapshotWriter:
+    """Appends book records of one run to its snapshot directory (not thread-safe)."""
+
+    def __init__(self, path, kind="details"):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        existing = glob.glob(os.path.join(path, "books.ndjson.*"))
+        # A resumed run keeps the codec it started with
+        self.codec = existing[0].rsplit('.', 1)[-1] if existing else _codec()
+        self.books = LineWriter(os.path.join(path, f"books.ndjson.{self.codec}"), self.codec)
+        self.stock = LineWriter(os.path.join(path, f"stock.tsv.{self.codec}"), self.codec, STOCK_HEADER)
+        # URLs already in the snapshot, so carry_over() can add the rest
+        self.written = {book['url'] for book in iter_ndjson(self.books.path)} if self.books.count else set()
+        self.kind = kind
+        self.started_at = time.time()
+
+    def write(self, book):
+        self.written.add(book['url'])
+        self.books.write(json.dumps(book, ensure_ascii=False))
+        for loc in book.get('locations') or []:
+            self.stock.write(f"{_tsv(book['id'])}\t{_tsv(book['url'])}\t{_tsv(loc['branch'])}\t{loc['stock']}")
+        if len(self.books.pending) >= FLUSH_RECORDS:
+            self.flush()  # keep both files at the same frame boundary
+
+    def flush(self):
+        self.books.flush()
+        self.stock.flush()
+
+    def carry_over(self, urls, hashes):
+        """Adds the stored record (UploadHashStore) of every URL in `urls` not written this run.
+
+        Run over the whole URL list, this makes the snapshot a complete
+        picture of the catalog even when the run only fetched a delta.
+        Returns how many records were copied.
+        """
+        missing = set(urls) - self.written
+        copied = 0
+        # One pass over the stored records instead of one lookup per catalog URL
+        for url, record in hashes.records():
+            if url in missing:
+                self.write(record)
+                copied += 1
+        return copied
+
+    def close(self, **extra):
+        """Flushes and writes manifest.json, which marks the snapshot as complete."""
+        self.books.close()
+        self.stock.close()
+        manifest = {
+            "kind": self.kind,
+            "codec": self.codec,
+            "started_at": self.started_at,
+            "finished_at": time.time(),
+            "books": self.books.count,
+            "stock_rows": self.stock.count,
+            **extra,
+        }
+        tmp = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, "manifest.json"))
+        return manifest
+
+
+def new_snapshot(name=None, directory=SNAPSHOT_DIR, resume=False, kind="details"):
+    """Writer for a new run directory, or with `resume` for the newest unfinished one."""
+    if resume:
+        unfinished = [path for path in list_snapshots(directory)
+                      if not os.path.exists(os.path.join(path, "manifest.json"))]
+        if unfinished:
+            return SnapshotWriter(unfinished[-1], kind)
+    name = name or time.strftime("%Y%m%dT%H%M%S")
+    return SnapshotWriter(os.path.join(directory, name), kind)
+
+
+def resolve_snapshot(name, directory=SNAPSHOT_DIR):
+    """Path of a snapshot given as a directory or as a run name, or None."""
+    for path in (name, os.path.join(directory, name)):
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def list_snapshots(directory=SNAPSHOT_DIR):
+    """Snapshot directories, oldest first (names start with the run's timestamp)."""
+    return sorted(path for path in glob.glob(os.path.join(directory, "*"))
+                  if glob.glob(os.path.join(path, "books.ndjson.*")))
+
+
+def _data_file(path, name):
+    matches = glob.glob(os.path.join(path, f"{name}.*"))
+    if not matches:
+        raise FileNotFoundError(f"No {name} file in {path}")
+    return matches[0]
+
+
+def _repair(path, codec):
+    """Counts the lines of an existing data file, rewriting it without its torn last frame if needed."""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return 0
+    try:
+        return sum(1 for _ in _iter_lines(path, strict=True))
+    except (EOFError, zlib.error, getattr(zstandard, 'ZstdError', EOFError)):
+        pass
+    tmp = f"{path}.tmp"
+    count = 0
+    with open(tmp, 'wb') as out:
+        chunk = []
+        for line in _iter_lines(path):
+            chunk.append(line)
+            count += 1
+            if len(chunk) >= FLUSH_RECORDS:
+                out.write(_compress(("\n".join(chunk) + "\n").encode('utf-8'), codec))
+                chunk = []
+        if chunk:
+            out.write(_compress(("\n".join(chunk) + "\n").encode('utf-8'), codec))
+    os.replace(tmp, path)
+    return count
+
+
+def _iter_lines(path, strict=False):
+    """Yields decoded lines across all frames; a torn last frame ends the stream quietly unless `strict`."""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed (pip install zstandard)")
+        raw = open(path, 'rb')
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+    else:
+        raw = open(path, 'rb')
+        stream = gzip.GzipFile(fileobj=raw)  # reads concatenated members
+    try:
+        for line in io.TextIOWrapper(stream, encoding='utf-8'):
+            if line.endswith('\n'):
+                yield line[:-1]
+    except (EOFError, zlib.error, getattr(zstandard, 'ZstdError', EOFError)):
+        if strict:
+            raise
+        return  # the run crashed while writing this frame
+    finally:
+        stream.close()
+        raw.close()
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, "manifest.json"), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def iter_ndjson(path):
+    """Streams the JSON objects of a (compressed) NDJSON file."""
+    for line in _iter_lines(path):
+        if line:
+            yield json.loads(line)
+
+
+def iter_books(path):
+    """Streams the book records of a snapshot."""
+    return iter_ndjson(_data_file(path, "books.ndjson"))
+
+
+def iter_stock(path):
+    """Streams (id, url, branch, stock) rows of a snapshot's flattened locations."""
+    lines = _iter_lines(_data_file(path, "stock.tsv"))
+    next(lines, None)  # header
+    for line in lines:
+        book_id, url, branch, stock = line.split('\t')
+        yield _untsv(book_id), _untsv(url), _untsv(branch), int(stock)
+
+
+def prune_snapshots(keep=KEEP_SNAPSHOTS, max_age_days=MAX_AGE_DAYS, directory=SNAPSHOT_DIR):
+    """Deletes finished snapshots beyond the newest `keep` of their kind once older than `max_age_days`.
+
+    Returns the deleted paths.
+    """
+    by_kind = {}
+    for path in list_snapshots(directory):
+        manifest = read_manifest(path)
+        if manifest:
+            # Run names start with a %Y%m%dT%H%M%S timestamp; the rest is the kind of run
+            by_kind.setdefault(os.path.basename(path)[15:], []).append((path, manifest))
+    cutoff = time.time() - max_age_days * 86400
+    deleted = []
+    for snapshots in by_kind.values():
+        for path, manifest in snapshots[:-max(keep, 1)]:
+            if manifest.get("finished_at", 0) < cutoff:
+                shutil.rmtree(path)
+                deleted.append(path)
+    return deleted
+
+
+def export_state(conn, name=None, directory=SNAPSHOT_DIR):
+    """Writes every record in the worker state (book_sources) as a full snapshot."""
+    writer = new_snapshot(name or time.strftime("%Y%m%dT%H%M%S") + "-export", directory, kind="export")
+    for (record,) in conn.execute("SELECT record FROM book_sources ORDER BY url"):
+        writer.write(json.loads(record))
+    return writer.path, writer.close()
+
+
+def _record_key(line):
+    match = RECORD_KEY_RE.match(line)
+    if match is None:
+        book = json.loads(line)
+        return book['id'], book['url']
+    book_id, url = match.groups()
+    if '\\' in book_id or '\\' in url:
+        book_id, url = json.loads(f'"{book_id}"'), json.loads(f'"{url}"')
+    return book_id, url
+
+
+def iter_merged(path):
+    """Streams one record per book id, merged over its URLs like the worker does.
+
+    Two streaming passes: the first finds the last line of every (id, URL)
+    (a resumed run may have written a page twice), the second yields the
+    records, holding back only ids that span several URLs until all their
+    records have been read.
+    """
+    from worker_state import merge_records
+
+    last = {}
+    urls_per_id = {}
+    for line_no, line in enumerate(line for line in _iter_lines(_data_file(path, "books.ndjson")) if line):
+        key = _record_key(line)
+        if key not in last:
+            urls_per_id[key[0]] = urls_per_id.get(key[0], 0) + 1
+        last[key] = line_no
+
+    waiting = {}
+    for line_no, book in enumerate(iter_books(path)):
+        if last[book['id'], book['url']] != line_no:
+            continue
+        if urls_per_id[book['id']] == 1:
+            yield book
+            continue
+        records = waiting.setdefault(book['id'], [])
+        records.append(book)
+        if len(records) == urls_per_id[book['id']]:
+            yield merge_records(waiting.pop(book['id']))
+
+
+def upload_snapshot(path):
+    """Re-sends a snapshot through the batch API."""
+    from bibliometro_details import API_URL, API_SECRET
+    from uploader import BatchUploader
+
+    uploader = BatchUploader(API_URL, API_SECRET)
+    for book in iter_merged(path):
+        uploader.submit(book)
+    uploader.close()
+    return uploader.stats
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Catalog snapshots")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="List snapshots and their manifests")
+    export = sub.add_parser('export', help="Write a full snapshot of the worker state (no network), then prune")
+    prune = sub.add_parser('prune', help="Delete old finished snapshots")
+    for command in (export, prune):
+        command.add_argument('--keep', type=int, default=KEEP_SNAPSHOTS,
+                             help="Finished snapshots always kept per kind of run")
+        command.add_argument('--max-age-days', type=float, default=MAX_AGE_DAYS,
+                             help="Older snapshots beyond --keep are deleted")
+    upload = sub.add_parser('upload', help="Re-upload a snapshot through the batch API")
+    upload.add_argument('snapshot', help="Snapshot directory or name")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == 'list':
+        for path in list_snapshots():
+            manifest = read_manifest(path)
+            if manifest:
+                print(f"{os.path.basename(path)}  {manifest['kind']:<8} {manifest['books']:>7} books "
+                      f"{manifest['stock_rows']:>8} stock rows  .{manifest['codec']}")
+            else:
+                print(f"{os.path.basename(path)}  (unfinished)")
+    elif args.command == 'export':
+        from worker_state import open_state
+        conn = open_state()
+        try:
+            path, manifest = export_state(conn)
+        finally:
+            conn.close()
+        print(f"📸 {manifest['books']} records written to {path}")
+        deleted = prune_snapshots(args.keep, args.max_age_days)
+        print(f"🧹 {len(deleted)} old snapshots pruned.")
+    elif args.command == 'prune':
+        for path in prune_snapshots(args.keep, args.max_age_days):
+            print(f"🧹 Deleted {path}")
+    else:
+        path = resolve_snapshot(args.snapshot)
+        if not path:
+            print(f"❌ Snapshot not found: {args.snapshot}")
+            sys.exit(1)
+        stats = upload_snapshot(path)
+        print(f"📦 Re-uploaded {stats['books']} books in {stats['batches']} batches.")
@@ -0,0 +1,160 @@
+import gzip
+import json
+import queue
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from metrics import SIZE_BUCKETS
+
+# Adaptive batch sizing
+MIN_BATCH = 10
+MAX_BATCH = 500
+TARGET_SECONDS = 2.0          # aim for POSTs that take about this long
+MAX_PAYLOAD_BYTES = 4_000_000  # uncompressed JSON per request (server limit is 50mb)
+LINGER_SECONDS = 2.0          # send a partial batch if nothing arrives for this long
+SHUTDOWN_RETRIES = 3
+
+
+class BatchUploader:
+    """Background uploader for /api/books/batch.
+
+    Books are submitted to a bounded queue and sent from one thread over a
+    single persistent, pooled connection as gzip-compressed JSON. The batch
+    size grows while the server answers quickly and shrinks when requests get
+    slow or payloads get large. Failed batches are kept and retried on close().
+
+    `on_uploaded(books, ok)` is called from the uploader thread after every attempt.
+    With `metrics`, every POST records its latency, batch size and payload bytes.
+    """
+
+    def __init__(self, api_url, api_secret, on_uploaded=None, queue_size=1000, metrics=None):
+        self.api_url = api_url
+        self.on_uploaded = on_uploaded
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = MIN_BATCH
+        self.failed = []
+        self.stats = {"batches": 0, "books": 0, "bytes": 0, "gzip_bytes": 0, "failed": 0}
+
+        self.session = requests.Session()
+        retry = Retry(connect=3, backoff_factor=1)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "x-api-secret": api_secret or ""
+        })
+
+        self.thread = threading.Thread(target=self._run, name="batch-uploader", daemon=True)
+        self.thread.start()
+
+    def submit(self, book, block=True):
+        """Queues one book_data. Raises queue.Full if `block` is False and the queue is full."""
+        self.queue.put(book, block=block)
+
+    def close(self):
+        """Flushes the last partial batch, retries failed batches and stops the thread."""
+        self.queue.put(None)
+        self.thread.join()
+
+        for attempt in range(SHUTDOWN_RETRIES):
+            if not self.failed:
+                break
+            time.sleep(2 ** attempt)
+            pending, self.failed = self.failed, []
+            if self.metrics:
+                self.metrics.inc("retries_total", len(pending), reason="upload")
+            print(f"   🔁 Retrying {len(pending)} failed batches (attempt {attempt + 1}/{SHUTDOWN_RETRIES})...")
+            for books in pending:
+                self._send(books)
+
+        if self.failed:
+            lost = sum(len(books) for books in self.failed)
+            print(f"   ❌ {len(self.failed)} batches ({lost} books) could not be uploaded.")
+        self.session.close()
+        return not self.failed
+
+    def _run(self):
+        batch = []
+        batch_bytes = 0
+        while True:
+            try:
+                book = self.queue.get(timeout=LINGER_SECONDS)
+            except queue.Empty:
+                if batch:
+                    self._send(batch)
+                    batch, batch_bytes = [], 0
+                continue
+
+            if book is None:
+                break
+            batch.append(book)
+            batch_bytes += len(json.dumps(book, ensure_ascii=False).encode('utf-8'))
+            if len(batch) >= self.batch_size or batch_bytes >= MAX_PAYLOAD_BYTES:
+                self._send(batch)
+                batch, batch_bytes = [], 0
+
+        # Final batch
+        if batch:
+            self._send(batch)
+
+    def _send(self, books):
+        # Deduplicate books by ID within the batch (simple strategy)
+        unique_books = {}
+        for book in books:
+            unique_books[book['id']] = book
+        final_batch = list(unique_books.values())
+
+        raw = json.dumps(final_batch, ensure_ascii=False).encode('utf-8')
+        body = gzip.compress(raw, compresslevel=6)
+
+        ok = False
+        started = time.monotonic()
+        try:
+            resp = self.session.post(self.api_url, data=body, timeout=60)
+            if resp.status_code == 200:
+                ok = True
+                print(f"   🚀 Successfully uploaded batch of {len(final_batch)} books "
+                      f"({len(body) / 1000:.0f} KB gzip, {time.monotonic() - started:.2f}s).")
+            else:
+                print(f"   ❌ API Upload failed ({resp.status_code}): {resp.text}")
+        except Exception as e:
+            print(f"   ❌ API Connection failed: {e}")
+        elapsed = time.monotonic() - started
+
+        if self.metrics:
+            self.metrics.observe("upload_seconds", elapsed)
+            self.metrics.observe("upload_batch_size", len(final_batch), buckets=SIZE_BUCKETS)
+            self.metrics.inc("upload_bytes_total", len(body))
+            self.metrics.inc("uploads_total", result="ok" if ok else "failed")
+
+        if ok:
+            self.stats["batches"] += 1
+            self.stats["books"] += len(final_batch)
+            self.stats["bytes"] += len(raw)
+            self.stats["gzip_bytes"] += len(body)
+            self._adapt(len(final_batch), len(raw), elapsed)
+        else:
+            self.stats["failed"] += 1
+            self.failed.append(books)
+            self.batch_size = max(MIN_BATCH, self.batch_size // 2)
+
+        if self.on_uploaded:
+            self.on_uploaded(books, ok)
+
+    def _adapt(self, count, payload_bytes, elapsed):
+        """Grows the batch while POSTs are fast, halves it when they are slow."""
+        if elapsed > TARGET_SECONDS:
+            size = self.batch_size // 2
+        elif elapsed < TARGET_SECONDS / 2:
+            size = self.batch_size + max(MIN_BATCH, self.batch_size // 4)
+        else:
+            size = self.batch_size
+        # Keep the uncompressed payload under the limit
+        per_book = payload_bytes / max(count, 1)
+        size = min(size, int(MAX_PAYLOAD_BYTES / max(per_book, 1)))
+        self.batch_size = max(MIN_BATCH, min(MAX_BATCH, size))
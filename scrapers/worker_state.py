@@ -0,0 +1,468 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+
+# Local state shared by the scraper runs (validators, hashes, journal...)
+STATE_FILE = os.path.join(os.path.dirname(__file__), "worker_state.sqlite")
+BUSY_TIMEOUT_MS = int(os.getenv('SCRAPER_STATE_BUSY_TIMEOUT_MS', '30000'))
+
+
+def open_state(path=STATE_FILE):
+    """Opens (and creates if needed) the local SQLite state file.
+
+    A state file is written by one process at a time (WAL allows a single
+    writer): sharded workers have their own file and only touch the main
+    one in short transactions, so a writer waits up to BUSY_TIMEOUT_MS for
+    the lock instead of failing with "database is locked".
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ValidatorStore:
+    """Per-URL ETag/Last-Modified values plus the cost of the last full download.
+
+    `table` keeps a separate set of validators, e.g. for the stock refresher,
+    whose 200s must not hide other field changes from the full worker.
+    """
+
+    def __init__(self, conn, table="validators"):
+        self.conn = conn
+        self.table = table
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER,
+                parse_seconds REAL,
+                checked_at REAL
+            )
+        """)
+        self.conn.commit()
+
+    def conditional_headers(self, url):
+        """Returns the If-None-Match/If-Modified-Since headers for `url`, if any."""
+        row = self.conn.execute(
+            f"SELECT etag, last_modified FROM {self.table} WHERE url = ?", (url,)
+        ).fetchone()
+        headers = {}
+        if row:
+            etag, last_modified = row
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def saved_cost(self, url):
+        """Returns (bytes, parse_seconds) a 304 for `url` saved us."""
+        row = self.conn.execute(
+            f"SELECT size, parse_seconds FROM {self.table} WHERE url = ?", (url,)
+        ).fetchone()
+        return (row[0] or 0, row[1] or 0.0) if row else (0, 0.0)
+
+    def record(self, url, etag, last_modified, size, parse_seconds):
+        if not etag and not last_modified:
+            return
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, size, parse_seconds, time.time())
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+
+class LastmodStore:
+    """Sitemap <lastmod> per URL, used to build the delta list.
+
+    The master only observes lastmods (`sitemap_seen`); a lastmod becomes
+    the URL's reference in `sitemap_lastmod` when the worker has uploaded
+    the page (confirm()). A page that failed, or that the worker has not
+    reached yet, stays in the delta until it is uploaded.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sitemap_lastmod (
+                url TEXT PRIMARY KEY,
+                lastmod TEXT,
+                seen_at REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sitemap_seen (
+                url TEXT PRIMARY KEY,
+                lastmod TEXT,
+                seen_at REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        self.conn.commit()
+
+    def changed(self, url, lastmod):
+        """True if `url` was never uploaded or its lastmod differs from the uploaded one."""
+        row = self.conn.execute(
+            "SELECT lastmod FROM sitemap_lastmod WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return True
+        return lastmod is not None and lastmod != row[0]
+
+    def observe(self, url, lastmod):
+        """Stores the lastmod the master saw for `url`, to be confirmed once the page is uploaded."""
+        # Keep the previous lastmod when this run only saw the URL in a category listing
+        self.conn.execute("""
+            INSERT INTO sitemap_seen VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                lastmod = COALESCE(excluded.lastmod, sitemap_seen.lastmod),
+                seen_at = excluded.seen_at
+        """, (url, lastmod, time.time()))
+
+    def confirm(self, url):
+        """Makes the last observed lastmod of `url` its reference: the worker has uploaded the page."""
+        self.conn.execute("""
+            INSERT INTO sitemap_lastmod VALUES (?, (SELECT lastmod FROM sitemap_seen WHERE url = ?), ?)
+            ON CONFLICT(url) DO UPDATE SET
+                lastmod = COALESCE(excluded.lastmod, sitemap_lastmod.lastmod),
+                seen_at = excluded.seen_at
+        """, (url, url, time.time()))
+
+    def confirm_all(self, urls):
+        """confirm() for many URLs in one statement."""
+        now = time.time()
+        self.conn.executemany("""
+            INSERT INTO sitemap_lastmod VALUES (?, (SELECT lastmod FROM sitemap_seen WHERE url = ?), ?)
+            ON CONFLICT(url) DO UPDATE SET
+                lastmod = COALESCE(excluded.lastmod, sitemap_lastmod.lastmod),
+                seen_at = excluded.seen_at
+        """, ((url, url, now) for url in urls))
+
+    def last_full_sweep(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'last_full_sweep'").fetchone()
+        return float(row[0]) if row else 0.0
+
+    def mark_full_sweep(self):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('last_full_sweep', ?)", (str(time.time()),)
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+
+def content_hash(book):
+    """Stable hash of everything we upload for a book."""
+    record = dict(book)
+    record['locations'] = sorted(book.get('locations') or [], key=lambda loc: loc['branch'])
+    raw = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(raw.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def merge_records(records):
+    """Merges the records of one id (same title, different URLs) into one book.
+
+    The record with the smallest URL is the base, missing fields are filled
+    from the others and stock is summed per branch, so the result does not
+    depend on the order pages were scraped in.
+    """
+    records = sorted(records, key=lambda book: book['url'])
+    merged = dict(records[0])
+    stock = {}
+    for book in records:
+        for key, value in book.items():
+            if merged.get(key) is None and value is not None:
+                merged[key] = value
+        for loc in book.get('locations') or []:
+            stock[loc['branch']] = stock.get(loc['branch'], 0) + loc['stock']
+    merged['locations'] = [{"branch": branch, "stock": count} for branch, count in stock.items()]
+    return merged
+
+
+class UploadHashStore:
+    """Last-uploaded content hash per book id, plus the latest record seen at each URL.
+
+    generate_id() gives the same id to every URL with the same title, so the
+    record uploaded for an id is the merge of all its URLs, not whichever page
+    was scraped last.
+    """
+
+    COMMIT_EVERY = 200
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.writes = 0
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS upload_hashes (
+                id TEXT PRIMARY KEY,
+                hash TEXT,
+                uploaded_at REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS book_sources (
+                id TEXT,
+                url TEXT,
+                record TEXT,
+                seen_at REAL,
+                PRIMARY KEY (id, url)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS book_sources_url ON book_sources (url)")
+        self.conn.commit()
+
+    def merge(self, book):
+        """Stores `book` as the latest record for its URL and returns the merged record for its id."""
+        # A retitled page gets a new id: its record under the old id is replaced, not kept
+        self.conn.execute("DELETE FROM book_sources WHERE url = ? AND id != ?", (book['url'], book['id']))
+        self.conn.execute(
+            "INSERT OR REPLACE INTO book_sources VALUES (?, ?, ?, ?)",
+            (book['id'], book['url'], json.dumps(book, ensure_ascii=False), time.time())
+        )
+        self._written()
+        rows = self.conn.execute(
+            "SELECT record FROM book_sources WHERE id = ?", (book['id'],)
+        ).fetchall()
+        if len(rows) == 1:
+            return book
+        return merge_records([json.loads(row[0]) for row in rows])
+
+    def changed(self, book):
+        """True if `book` differs from what was last uploaded for its id."""
+        row = self.conn.execute(
+            "SELECT hash FROM upload_hashes WHERE id = ?", (book['id'],)
+        ).fetchone()
+        return row is None or row[0] != content_hash(book)
+
+    def record(self, url):
+        """Latest record stored for `url`, or None."""
+        row = self.conn.execute("SELECT record FROM book_sources WHERE url = ?", (url,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def records(self):
+        """(url, record) of every stored URL, in URL order, from one scan of the table."""
+        for url, raw in self.conn.execute("SELECT url, record FROM book_sources ORDER BY url"):
+            yield url, json.loads(raw)
+
+    def update_locations(self, url, locations):
+        """Replaces the stock of the record stored for `url`.
+
+        Returns (id, merged record before, merged record after), or None if
+        `url` has never been scraped in full.
+        """
+        row = self.conn.execute("SELECT id FROM book_sources WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        book_id = row[0]
+        before, after = [], []
+        for source, raw in self.conn.execute(
+                "SELECT url, record FROM book_sources WHERE id = ?", (book_id,)).fetchall():
+            book = json.loads(raw)
+            before.append(book)
+            if source == url:
+                book = dict(book, locations=locations)
+                self.conn.execute(
+                    "UPDATE book_sources SET record = ?, seen_at = ? WHERE id = ? AND url = ?",
+                    (json.dumps(book, ensure_ascii=False), time.time(), book_id, url)
+                )
+                self._written()
+            after.append(book)
+        return book_id, merge_records(before), merge_records(after)
+
+    def mark_uploaded(self, books):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO upload_hashes VALUES (?, ?, ?)",
+            [(book['id'], content_hash(book), now) for book in books]
+        )
+        self._written(len(books))
+
+    def _written(self, count=1):
+        self.writes += count
+        if self.writes >= self.COMMIT_EVERY:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.writes = 0
+
+
+def same_stock(a, b):
+    """True if two locations lists hold the same stock per branch, in any order."""
+    return sorted((loc['branch'], loc['stock']) for loc in a or []) == \
+        sorted((loc['branch'], loc['stock']) for loc in b or [])
+
+
+class StockStore:
+    """How often each URL's stock changes, used to order the hourly stock refresh.
+
+    Volatility is an exponentially decaying count of observed stock changes
+    (half-life HALF_LIFE_HOURS). The refresh priority adds the hours since the
+    last check and, as a popularity proxy, the number of branches holding the book.
+    """
+
+    HALF_LIFE_HOURS = 72.0
+    STALENESS_WEIGHT = 1 / 24  # one point per day without a check
+    POPULARITY_WEIGHT = 0.25
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS stock_refresh (
+                url TEXT PRIMARY KEY,
+                volatility REAL DEFAULT 0,
+                changes INTEGER DEFAULT 0,
+                checked_at REAL,
+                changed_at REAL
+            )
+        """)
+        self.conn.commit()
+
+    def _decay(self, volatility, since, now):
+        if not volatility or not since:
+            return volatility or 0.0
+        return volatility * 0.5 ** ((now - since) / 3600 / self.HALF_LIFE_HOURS)
+
+    def prioritized(self):
+        """Every fully scraped URL, most volatile / stalest / most widely held first."""
+        now = time.time()
+        rows = self.conn.execute("""
+            SELECT s.url, s.record, r.volatility, r.checked_at
+            FROM book_sources s LEFT JOIN stock_refresh r ON r.url = s.url
+        """).fetchall()
+        scored = []
+        for url, record, volatility, checked_at in rows:
+            hours = (now - checked_at) / 3600 if checked_at else 24 * 7
+            branches = len(json.loads(record).get('locations') or [])
+            score = (self._decay(volatility, checked_at, now)
+                     + self.STALENESS_WEIGHT * hours
+                     + self.POPULARITY_WEIGHT * math.log1p(branches))
+            scored.append((score, url))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [url for _, url in scored]
+
+    def record(self, url, changed):
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT volatility, checked_at FROM stock_refresh WHERE url = ?", (url,)
+        ).fetchone()
+        volatility = self._decay(*row, now) if row else 0.0
+        if changed:
+            volatility += 1.0
+        self.conn.execute("""
+            INSERT INTO stock_refresh VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                volatility = excluded.volatility,
+                changes = stock_refresh.changes + excluded.changes,
+                checked_at = excluded.checked_at,
+                changed_at = COALESCE(excluded.changed_at, stock_refresh.changed_at)
+        """, (url, volatility, int(changed), now, now if changed else None))
+
+    def commit(self):
+        self.conn.commit()
+
+
+class Journal:
+    """Durable per-URL progress of the detail worker.
+
+    Status is one of pending / fetched / uploaded / failed. `uploaded` also
+    covers pages that needed no upload (304 or unchanged content). Failures
+    keep a reason and an attempt count, and are retried with exponential
+    backoff until MAX_ATTEMPTS.
+    """
+
+    MAX_ATTEMPTS = 5
+    BACKOFF_SECONDS = 5.0
+    COMMIT_EVERY = 200
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.writes = 0
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS journal (
+                url TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                reason TEXT,
+                attempts INTEGER DEFAULT 0,
+                next_attempt_at REAL DEFAULT 0,
+                updated_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS journal_status ON journal (status)")
+        self.conn.commit()
+
+    def start_run(self, urls):
+        """Starts a fresh run: every URL goes back to pending."""
+        now = time.time()
+        self.conn.execute("DELETE FROM journal")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO journal (url, status, updated_at) VALUES (?, 'pending', ?)",
+            ((url, now) for url in urls)
+        )
+        self.conn.commit()
+
+    def add(self, url):
+        """Adds a URL discovered during the run as pending (no-op if already journaled)."""
+        self._write(
+            "INSERT OR IGNORE INTO journal (url, status, updated_at) VALUES (?, 'pending', ?)",
+            (url, time.time())
+        )
+
+    def resumable(self):
+        """URLs left unfinished by the previous run, plus failures that are due for a retry."""
+        rows = self.conn.execute("""
+            SELECT url FROM journal
+            WHERE status IN ('pending', 'fetched')
+               OR (status = 'failed' AND attempts < ? AND next_attempt_at <= ?)
+            ORDER BY url
+        """, (self.MAX_ATTEMPTS, time.time())).fetchall()
+        return [row[0] for row in rows]
+
+    def mark(self, url, status):
+        self._write(
+            "UPDATE journal SET status = ?, reason = NULL, updated_at = ? WHERE url = ?",
+            (status, time.time(), url)
+        )
+
+    def fail(self, url, reason, permanent=False):
+        """Records a failure. Returns the backoff delay before the next attempt, or None if out of attempts."""
+        row = self.conn.execute("SELECT attempts FROM journal WHERE url = ?", (url,)).fetchone()
+        attempts = self.MAX_ATTEMPTS if permanent else (row[0] if row else 0) + 1
+        delay = self.BACKOFF_SECONDS * 2 ** (attempts - 1)
+        now = time.time()
+        self._write("""
+            INSERT INTO journal VALUES (?, 'failed', ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                status = 'failed', reason = excluded.reason, attempts = excluded.attempts,
+                next_attempt_at = excluded.next_attempt_at, updated_at = excluded.updated_at
+        """, (url, str(reason)[:500], attempts, now + delay, now))
+        return delay if attempts < self.MAX_ATTEMPTS else None
+
+    def summary(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM journal GROUP BY status").fetchall())
+
+    def urls(self, status):
+        rows = self.conn.execute("SELECT url FROM journal WHERE status = ? ORDER BY url", (status,)).fetchall()
+        return [row[0] for row in rows]
+
+    def _write(self, sql, params):
+        self.conn.execute(sql, params)
+        self.writes += 1
+        if self.writes % self.COMMIT_EVERY == 0:
+            self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
@@ -0,0 +1,183 @@
+"""Availability analytics over the whole bibliometro catalog.
+
+Streams every bibliometro row (id, category, locations) through a
+server-side cursor, or from a scraper snapshot without touching the
+database, into a branch x book stock matrix, then reports:
+
+- per-branch totals (copies and titles available)
+- books with zero stock at every branch
+- coverage per category (share of its books available somewhere)
+
+    python scripts/stock_analytics.py
+    python scripts/stock_analytics.py --snapshot latest --json report.json
+"""
+import argparse
+import json
+import os
+import sys
+from array import array
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+SCRAPERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scrapers')
+FETCH_ROWS = 5000           # rows per round trip of the server-side cursor
+UNCATEGORIZED = "(sin categoría)"
+
+
+class StockMatrix:
+    """Stock per (branch, book) as a dense NumPy matrix with interned branch and category names.
+
+    Rows are added one book at a time into flat (branch, book, stock)
+    arrays; build() turns them into a uint8 matrix (uint16 if any branch
+    holds more than 255 copies of a title).
+    """
+
+    def __init__(self):
+        self.branches = []
+        self.branch_index = {}
+        self.categories = []
+        self.category_index = {}
+        self.book_ids = []
+        self.book_categories = array('I')
+        self._rows = array('I')
+        self._cols = array('I')
+        self._stock = array('I')
+        self.matrix = None
+
+    def _intern(self, names, index, name):
+        code = index.get(name)
+        if code is None:
+            code = index[name] = len(names)
+            names.append(name)
+        return code
+
+    def add(self, book_id, category, locations):
+        col = len(self.book_ids)
+        self.book_ids.append(book_id)
+        self.book_categories.append(self._intern(self.categories, self.category_index,
+                                                 category or UNCATEGORIZED))
+        for loc in locations or []:
+            row = self._intern(self.branches, self.branch_index, loc['branch'])
+            if loc.get('stock'):
+                self._rows.append(row)
+                self._cols.append(col)
+                self._stock.append(int(loc['stock']))
+
+    def build(self):
+        stock = np.frombuffer(self._stock, dtype=np.uint32)
+        dtype = np.uint8 if not len(stock) or stock.max() <= np.iinfo(np.uint8).max else np.uint16
+        self.matrix = np.zeros((len(self.branches), len(self.book_ids)), dtype=dtype)
+        # A branch listed twice for one book adds up, like merge_records() does
+        np.add.at(self.matrix, (np.frombuffer(self._rows, dtype=np.uint32),
+                                np.frombuffer(self._cols, dtype=np.uint32)),
+                  np.minimum(stock, np.iinfo(dtype).max).astype(dtype))
+        self._rows, self._cols, self._stock = array('I'), array('I'), array('I')
+        return self
+
+    # --- reports -----------------------------------------------------------
+
+    def branch_totals(self):
+        """[(branch, copies, titles)] sorted by copies, descending."""
+        copies = self.matrix.sum(axis=1, dtype=np.int64)
+        titles = np.count_nonzero(self.matrix, axis=1)
+        order = np.argsort(-copies, kind='stable')
+        return [(self.branches[i], int(copies[i]), int(titles[i])) for i in order]
+
+    def zero_stock(self):
+        """Ids of the books with no copy at any branch."""
+        available = self.matrix.any(axis=0) if len(self.branches) else np.zeros(len(self.book_ids), bool)
+        return [self.book_ids[i] for i in np.flatnonzero(~available)]
+
+    def category_coverage(self):
+        """[(category, books, available, share)] sorted by book count, descending."""
+        codes = np.frombuffer(self.book_categories, dtype=np.uint32)
+        available = self.matrix.any(axis=0) if len(self.branches) else np.zeros(len(codes), bool)
+        books = np.bincount(codes, minlength=len(self.categories))
+        hits = np.bincount(codes, weights=available, minlength=len(self.categories)).astype(np.int64)
+        order = np.argsort(-books, kind='stable')
+        return [(self.categories[i], int(books[i]), int(hits[i]), float(hits[i] / books[i]))
+                for i in order if books[i]]
+
+
+def load_from_database(database_url=DATABASE_URL):
+    import psycopg2
+
+    matrix = StockMatrix()
+    conn = psycopg2.connect(database_url)
+    try:
+        # Named cursor = server-side: rows arrive FETCH_ROWS at a time
+        with conn.cursor(name='stock_analytics') as cur:
+            cur.itersize = FETCH_ROWS
+            cur.execute('SELECT "id", "category", "locations" FROM books WHERE source = %s',
+                        ('bibliometro',))
+            for book_id, category, locations in cur:
+                matrix.add(book_id, category, locations)
+    finally:
+        conn.close()
+    return matrix.build()
+
+
+def load_from_snapshot(name):
+    sys.path.insert(0, SCRAPERS_DIR)
+    from snapshots import iter_merged, list_snapshots, read_manifest, resolve_snapshot
+
+    if name == 'latest':
+        finished = [path for path in list_snapshots() if read_manifest(path)]
+        path = finished[-1] if finished else None
+    else:
+        path = resolve_snapshot(name)
+    if not path:
+        raise FileNotFoundError(f"Snapshot not found: {name}")
+    print(f"📸 Reading {path}")
+    matrix = StockMatrix()
+    for book in iter_merged(path):
+        matrix.add(book['id'], book.get('category'), book.get('locations'))
+    return matrix.build()
+
+
+def report(matrix, top=15):
+    branches = matrix.branch_totals()
+    zero = matrix.zero_stock()
+    coverage = matrix.category_coverage()
+    books = len(matrix.book_ids)
+
+    print(f"📚 {books} books, {len(matrix.branches)} branches, "
+          f"matrix {matrix.matrix.shape} {matrix.matrix.dtype} ({matrix.matrix.nbytes / 1000:.0f} KB)")
+    print("\n🏢 Per branch (copies / titles):")
+    for branch, copies, titles in branches:
+        print(f"   {branch:<35} {copies:>7} {titles:>7}")
+    print(f"\n🚫 {len(zero)} books ({100 * len(zero) / max(books, 1):.1f}%) with zero stock everywhere")
+    for book_id in zero[:5]:
+        print(f"   {book_id}")
+    print(f"\n🏷️ Coverage per category (top {top}):")
+    for category, count, available, share in coverage[:top]:
+        print(f"   {category[:35]:<35} {available:>6}/{count:<6} {100 * share:5.1f}%")
+    return {
+        "books": books,
+        "branches": [{"branch": b, "copies": c, "titles": t} for b, c, t in branches],
+        "zero_stock": zero,
+        "categories": [{"category": c, "books": n, "available": a, "coverage": round(s, 4)}
+                       for c, n, a, s in coverage],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stock analytics over the bibliometro catalog")
+    parser.add_argument('--snapshot', metavar='NAME',
+                        help="Read a scraper snapshot ('latest' or a run name) instead of the database")
+    parser.add_argument('--json', metavar='PATH', help="Also write the full report as JSON")
+    parser.add_argument('--top', type=int, default=15, help="Categories shown")
+    args = parser.parse_args()
+
+    if not args.snapshot and not DATABASE_URL:
+        print("❌ DATABASE_URL not found in .env (or use --snapshot)")
+        sys.exit(1)
+    matrix = load_from_snapshot(args.snapshot) if args.snapshot else load_from_database()
+    result = report(matrix, args.top)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\n📝 Report written to {args.json}")
@@ -1,5 +1,5 @@
 import Book from '../models/Book.js';
-import { Op } from 'sequelize';
+import { Op, QueryTypes } from 'sequelize';
 
 export const getBooks = async (req, res) => {
     try {
@@ -128,3 +128,60 @@ export const batchCreateBooks = async (req, res) => {
         });
     }
 };
+
+// Rows per UPDATE statement (two bind parameters each, well under Postgres' 65535 limit)
+const STOCK_UPDATE_CHUNK = 1000;
+
+export const batchUpdateStock = async (req, res) => {
+    try {
+        const updates = req.body;
+        const apiSecret = req.headers['x-api-secret'];
+
+        if (!process.env.API_SECRET || apiSecret !== process.env.API_SECRET) {
+            return res.status(401).json({ error: 'Unauthorized: Invalid API Secret' });
+        }
+
+        if (!Array.isArray(updates) || updates.length === 0) {
+            return res.status(400).json({ error: 'Input must be a non-empty array of {id, locations}' });
+        }
+
+        console.log(`📦 Stock Update: Processing ${updates.length} books...`);
+
+        // Stock-only partial update: every other column is left untouched.
+        // One set-based UPDATE ... FROM (VALUES ...) per chunk instead of a round trip per book.
+        let updated = 0;
+        await Book.sequelize.transaction(async (transaction) => {
+            for (let start = 0; start < updates.length; start += STOCK_UPDATE_CHUNK) {
+                const chunk = updates.slice(start, start + STOCK_UPDATE_CHUNK);
+                const bind = [];
+                const values = chunk.map(({ id, locations }) => {
+                    bind.push(id, JSON.stringify(locations || []));
+                    return `($${bind.length - 1}, $${bind.length}::jsonb)`;
+                });
+                const rows = await Book.sequelize.query(
+                    `UPDATE books SET locations = v.locations, "updatedAt" = NOW()
+                     FROM (VALUES ${values.join(', ')}) AS v(id, locations)
+                     WHERE books.id = v.id
+                     RETURNING books.id`,
+                    { bind, type: QueryTypes.SELECT, transaction }
+                );
+                updated += rows.length;
+            }
+        });
+
+        console.log(`✅ Stock Update Success: ${updated} updated.`);
+
+        res.json({
+            success: true,
+            message: `Updated stock of ${updated} books`,
+            count: updated
+        });
+
+    } catch (error) {
+        console.error('❌ Error in batchUpdateStock:', error);
+        res.status(500).json({
+            error: 'Internal Server Error during stock update',
+            details: error.message
+        });
+    }
+};
@@ -1,5 +1,5 @@
 import express from 'express';
-import { getBooks, searchBooksController, getBookById, batchCreateBooks } from '../controllers/bookController.js';
+import { getBooks, searchBooksController, getBookById, batchCreateBooks, batchUpdateStock } from '../controllers/bookController.js';
 
 const router = express.Router();
 
@@ -7,6 +7,7 @@ const router = express.Router();
 router.get('/', getBooks);
 router.get('/search', searchBooksController);
 router.post('/batch', batchCreateBooks); // New endpoint for scrapers
+router.post('/stock', batchUpdateStock); // Stock-only updates from the hourly refresher
 router.get('/:id', getBookById);
 
 export default router;
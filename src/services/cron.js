@@ -32,18 +32,18 @@ const runScraper = (scriptName) => {
 export const initCronJobs = () => {
     console.log('🕰️  Initializing Cron Jobs...');
 
-    // Run Master Scraper (URLs) at 03:00 AM
+    // Run Master + Worker as one streamed pipeline at 03:00 AM:
+    // detail extraction starts as soon as the crawler discovers URLs
     cron.schedule('0 3 * * *', () => {
-        console.log('🌙 Starting Bibliometro URL Crawler...');
-        runScraper('bibliometro_urls.py');
+        console.log('🌙 Starting Bibliometro Pipeline (URL Crawler + Detail Extraction)...');
+        runScraper('bibliometro_pipeline.py');
     });
 
-    // Run Worker Scraper (Details) at 04:00 AM
-    // Gives 1 hour for URL crawling to finish (usually takes minutes)
-    cron.schedule('0 4 * * *', () => {
-        console.log('🏗️ Starting Bibliometro Detail Extraction...');
-        runScraper('bibliometro_details.py');
+    // Refresh branch stock every hour during the day (stock-only, 45 min budget)
+    cron.schedule('0 8-22 * * *', () => {
+        console.log('📦 Starting Bibliometro Stock Refresh...');
+        runScraper('bibliometro_stock.py');
     });
 
-    console.log('✅ Cron Jobs Scheduled: Daily at 03:00 AM & 04:00 AM');
+    console.log('✅ Cron Jobs Scheduled: Daily pipeline at 03:00 AM, stock hourly 08:00-22:00');
 };
@@ -1,6 +1,9 @@
+import os
+import sys
 import requests
-from bs4 import BeautifulSoup
-import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'scrapers'))
+from book_extractor import extract_book
 
 TEST_URLS = [
     "https://bibliometro.cl/libros/100-artistas-sin-los-que-no-podria-vivir/",
@@ -23,44 +26,10 @@ for url in TEST_URLS:
     try:
         print(f"Processing: {url}")
         resp = requests.get(url, headers=headers, timeout=10)
-        soup = BeautifulSoup(resp.content, "html.parser")
-        
-        title_tag = soup.find('h1')
-        title = title_tag.get_text(strip=True) if title_tag else "NO TITLE"
-        
-        # --- AUTHOR ---
-        author = "Desconocido"
-        h4s = soup.find_all('h4')
-        for h4 in h4s:
-            txt = h4.get_text(strip=True)
-            if "ubicación" in txt.lower() or "comentarios" in txt.lower():
-                continue
-            if txt:
-                author = txt
-                break
-
-        if author == "Desconocido":
-            # Fallback
-            candidates = soup.find_all(['strong', 'b', 'span'])
-            for tag in candidates:
-                if "autor" in tag.get_text(strip=True).lower():
-                    if ":" in tag.get_text():
-                         parts = tag.get_text().split(":", 1)
-                         if len(parts) > 1 and parts[1].strip():
-                             author = parts[1].strip()
-                    elif tag.next_sibling and isinstance(tag.next_sibling, str):
-                         author = tag.next_sibling.strip()
-        
-        # --- PAGES ---
-        pages = None
-        strongs = soup.find_all('strong')
-        for s in strongs:
-            if "páginas" in s.get_text(strip=True).lower():
-                sib = s.next_sibling
-                if sib and isinstance(sib, str):
-                    match = re.search(r'(\d+)', sib)
-                    if match:
-                        pages = match.group(1)
+        book = extract_book(resp.content, url)
+        title = book["title"] if book else "NO TITLE"
+        author = book["author"] if book else "Desconocido"
+        pages = book["pages"] if book else None
 
         print(f"   📘 Title: {title}")
         print(f"   ✍️  Author: {author}")